@@ -2,46 +2,170 @@
 CREATE SCHEMA raw AUTHORIZATION postgres;
 CREATE SCHEMA spot AUTHORIZATION postgres;
 
--- raw layer
+-- raw layer: klines are list-partitioned by time_frame, so intraday pages don't bloat scans of the daily ones;
+-- responses are LZ4-compressed, candles holds their packed candle fields (--raw_format packed, RawETLoader.kline_packed_dtype)
 CREATE TABLE raw.exchange_api_kline (
 	exchange varchar NOT NULL,
 	symbol varchar NULL,
 	time_frame varchar NOT NULL,
 	insert_ts numeric NOT NULL,
-	"data" jsonb NULL
+	"data" jsonb COMPRESSION lz4 NULL,
+	candles bytea STORAGE EXTERNAL NULL
+) PARTITION BY LIST (time_frame);
+
+CREATE TABLE raw.exchange_api_kline_d PARTITION OF raw.exchange_api_kline FOR VALUES IN ('D');
+CREATE TABLE raw.exchange_api_kline_4h PARTITION OF raw.exchange_api_kline FOR VALUES IN ('4h');
+CREATE TABLE raw.exchange_api_kline_1h PARTITION OF raw.exchange_api_kline FOR VALUES IN ('1h');
+CREATE TABLE raw.exchange_api_kline_5m PARTITION OF raw.exchange_api_kline FOR VALUES IN ('5m');
+CREATE TABLE raw.exchange_api_kline_1m PARTITION OF raw.exchange_api_kline FOR VALUES IN ('1m');
+
+-- instrument info is stored as changes: current state per instrument and the log of change events
+CREATE TABLE raw.instrument_info_state (
+	exchange varchar NOT NULL,
+	symbol varchar NOT NULL,
+	native_symbol varchar NULL,
+	base_coin varchar NOT NULL,
+	quote_coin varchar NOT NULL,
+	trading_status varchar NOT NULL,
+	listed_ts numeric NOT NULL,
+	update_ts numeric NOT NULL,
+	CONSTRAINT instrument_info_state_pk PRIMARY KEY (exchange, symbol)
 );
+CREATE INDEX instrument_info_state_update_ts_idx ON raw.instrument_info_state (exchange, update_ts);
 
-CREATE TABLE raw.exchange_api_instrument_info (
+CREATE TABLE raw.instrument_info_event (
 	exchange varchar NOT NULL,
-	insert_ts numeric NOT NULL,
-	"data" jsonb NULL
+	symbol varchar NOT NULL,
+	event_type varchar NOT NULL,  -- listed | delisted | status_change | changed
+	native_symbol varchar NULL,
+	base_coin varchar NOT NULL,
+	quote_coin varchar NOT NULL,
+	trading_status varchar NOT NULL,
+	prev_trading_status varchar NULL,
+	insert_ts numeric NOT NULL
 );
+CREATE INDEX instrument_info_event_insert_ts_idx ON raw.instrument_info_event (exchange, insert_ts);
+
+-- symbols loaded to the dm layer per run, used to resume interrupted backfills
+CREATE TABLE raw.load_checkpoint (
+	run_key varchar NOT NULL,  -- <mode>:<start_dt>
+	exchange varchar NOT NULL,
+	symbol varchar NOT NULL,
+	window_start date NOT NULL,
+	window_end date NULL,
+	rows_loaded integer NOT NULL,
+	update_ts numeric NOT NULL,
+	CONSTRAINT load_checkpoint_pk PRIMARY KEY (run_key, exchange, symbol)
+);
+
+-- kline fetch tasks of distributed runs (worker.py), claimed by workers with FOR UPDATE SKIP LOCKED
+CREATE TABLE raw.kline_task (
+	task_id bigint GENERATED ALWAYS AS IDENTITY,
+	run_key varchar NOT NULL,  -- <mode>:<start_dt>
+	exchange varchar NOT NULL,
+	symbol varchar NOT NULL,  -- exchange's native symbol
+	time_frame varchar NOT NULL,
+	window_start timestamp NOT NULL,
+	window_end timestamp NULL,
+	status varchar NOT NULL,  -- pending | running | done | failed
+	attempts integer NOT NULL,
+	worker varchar NULL,
+	claimed_ts numeric NULL,
+	update_ts numeric NOT NULL,
+	error varchar NULL,
+	not_before numeric NULL,  -- failed task waits for its retry until then (backoff growing with attempts)
+	CONSTRAINT kline_task_pk PRIMARY KEY (task_id),
+	CONSTRAINT kline_task_uq UNIQUE (run_key, exchange, symbol, time_frame, window_start)
+);
+
+-- claims scan open tasks only
+CREATE INDEX kline_task_open_idx ON raw.kline_task USING btree (task_id) WHERE status IN ('pending', 'running');
 
 -- dm layer
+CREATE TABLE spot.dim_exchange (
+	exchange_id smallint NOT NULL,
+	exchange varchar NOT NULL,
+	CONSTRAINT exchange_pk PRIMARY KEY (exchange_id),
+	CONSTRAINT exchange_uq UNIQUE (exchange)
+);
+
+INSERT INTO spot.dim_exchange (exchange_id, exchange) VALUES
+	(1, 'BYBIT'),
+	(2, 'BINANCE'),
+	(3, 'GATEIO'),
+	(4, 'KRAKEN'),
+	(5, 'OKX');
+
+CREATE TABLE spot.dim_asset (
+	coin_id integer GENERATED ALWAYS AS IDENTITY,
+	coin varchar NOT NULL,
+	CONSTRAINT asset_pk PRIMARY KEY (coin_id),
+	CONSTRAINT asset_uq UNIQUE (coin)
+);
+
+-- instrument registry: (exchange, symbol) -> instrument_id; symbol is the normalised form stored in the raw layer,
+-- native_symbol is the exchange's own spelling (BTC_USDT, BTC-USDT, ...)
 CREATE TABLE spot.dim_coin (
+	instrument_id integer GENERATED ALWAYS AS IDENTITY,
+	exchange_id smallint NOT NULL,
 	exchange varchar NOT NULL,
 	symbol varchar NOT NULL,
+	native_symbol varchar NULL,
+	base_coin_id integer NOT NULL,
+	quote_coin_id integer NOT NULL,
 	base_coin varchar NOT NULL,
 	quote_coin varchar NOT NULL,
 	trading_status varchar NULL,
 	insert_ts numeric NULL,
-	CONSTRAINT coin_pk PRIMARY KEY (exchange, symbol)
+	CONSTRAINT coin_pk PRIMARY KEY (exchange, symbol),
+	CONSTRAINT coin_instrument_uq UNIQUE (instrument_id),
+	CONSTRAINT coin_exchange_fk FOREIGN KEY (exchange_id) REFERENCES spot.dim_exchange (exchange_id),
+	CONSTRAINT coin_base_fk FOREIGN KEY (base_coin_id) REFERENCES spot.dim_asset (coin_id),
+	CONSTRAINT coin_quote_fk FOREIGN KEY (quote_coin_id) REFERENCES spot.dim_asset (coin_id)
 );
 
+-- facts: integer surrogate keys, epoch-ms insert_ts as bigint, amounts as float8 (fixed 8 bytes instead of variable-length numeric)
 CREATE TABLE spot.tfct_exchange_rate (
-	exchange varchar NOT NULL,
-	coin varchar NOT NULL,
+	exchange_id smallint NOT NULL,
+	coin_id integer NOT NULL,
 	oper_dt date NOT NULL,
-	usdt_amt numeric NULL,
-	insert_ts numeric NULL,
-	CONSTRAINT exchange_rate_pk PRIMARY KEY (exchange, coin, oper_dt)
+	usdt_amt double precision NULL,
+	insert_ts bigint NULL,
+	CONSTRAINT exchange_rate_pk PRIMARY KEY (exchange_id, coin_id, oper_dt)
 );
 
+CREATE INDEX tfct_exchange_rate_oper_dt_idx ON spot.tfct_exchange_rate USING btree (oper_dt);
+
 CREATE TABLE spot.tfct_coin (
-	exchange varchar NOT NULL,
-	symbol varchar NOT NULL,
+	instrument_id integer NOT NULL,
 	oper_dt date NOT NULL,
-	vol_amt numeric NULL,
-	insert_ts numeric NULL,
-	CONSTRAINT tfct_coin_pk PRIMARY KEY (exchange, symbol, oper_dt)
-);
\ No newline at end of file
+	vol_amt double precision NULL,
+	insert_ts bigint NULL,
+	CONSTRAINT tfct_coin_pk PRIMARY KEY (instrument_id, oper_dt)
+);
+
+-- rows arrive (mostly) in oper_dt order, so a BRIN index covers dashboard date-range scans at a fraction of a B-tree size
+CREATE INDEX tfct_coin_oper_dt_brin ON spot.tfct_coin USING brin (oper_dt) WITH (pages_per_range = 32);
+
+-- intraday candles (main.py --time_frame 4h|1h|5m|1m) keyed by candle open time, range-partitioned by month;
+-- monthly partitions <table>_pYYYYMM are created by DmETLoader.ensure_partitions on load
+CREATE TABLE spot.tfct_coin_intraday (
+	instrument_id integer NOT NULL,
+	time_frame varchar(3) NOT NULL,
+	oper_ts timestamp NOT NULL,
+	vol_amt double precision NULL,
+	insert_ts bigint NULL,
+	CONSTRAINT tfct_coin_intraday_pk PRIMARY KEY (instrument_id, time_frame, oper_ts)
+) PARTITION BY RANGE (oper_ts);
+
+CREATE INDEX tfct_coin_intraday_oper_ts_brin ON spot.tfct_coin_intraday USING brin (oper_ts) WITH (pages_per_range = 32);
+
+CREATE TABLE spot.tfct_exchange_rate_intraday (
+	exchange_id smallint NOT NULL,
+	coin_id integer NOT NULL,
+	time_frame varchar(3) NOT NULL,
+	oper_ts timestamp NOT NULL,
+	usdt_amt double precision NULL,
+	insert_ts bigint NULL,
+	CONSTRAINT exchange_rate_intraday_pk PRIMARY KEY (exchange_id, coin_id, time_frame, oper_ts)
+) PARTITION BY RANGE (oper_ts);
@@ -0,0 +1,26 @@
+-- Compact typed storage for the DM fact tables (databases created before this change).
+-- Run report_tfct_storage.sql before and after to compare table size and date-range scan times:
+--   psql -h 127.0.0.1 -p 5431 -U postgres -d bhft -f db_migrations/report_tfct_storage.sql
+--   psql -h 127.0.0.1 -p 5431 -U postgres -d bhft -f db_migrations/001_tfct_compact_storage.sql
+--   psql -h 127.0.0.1 -p 5431 -U postgres -d bhft -f db_migrations/report_tfct_storage.sql
+
+BEGIN;
+
+ALTER TABLE spot.tfct_coin
+	ALTER COLUMN vol_amt TYPE double precision USING vol_amt::double precision,
+	ALTER COLUMN insert_ts TYPE bigint USING insert_ts::bigint;
+
+ALTER TABLE spot.tfct_exchange_rate
+	ALTER COLUMN usdt_amt TYPE double precision USING usdt_amt::double precision,
+	ALTER COLUMN insert_ts TYPE bigint USING insert_ts::bigint;
+
+CREATE INDEX IF NOT EXISTS tfct_coin_oper_dt_brin ON spot.tfct_coin USING brin (oper_dt) WITH (pages_per_range = 32);
+CREATE INDEX IF NOT EXISTS tfct_exchange_rate_oper_dt_idx ON spot.tfct_exchange_rate USING btree (oper_dt);
+
+COMMIT;
+
+-- ALTER ... TYPE rewrites the tables; CLUSTER by PK and refresh stats so BRIN ranges and the planner see the new layout
+CLUSTER spot.tfct_coin USING tfct_coin_pk;
+CLUSTER spot.tfct_exchange_rate USING exchange_rate_pk;
+ANALYZE spot.tfct_coin;
+ANALYZE spot.tfct_exchange_rate;
@@ -0,0 +1,114 @@
+-- Integer surrogate keys: exchange/asset dictionaries, instrument registry in dim_coin, id-keyed fact tables.
+-- Apply after 001_tfct_compact_storage.sql. The dashboard export in dashboard_files/ matches this layout,
+-- re-import it once the migration is done.
+
+BEGIN;
+
+CREATE TABLE spot.dim_exchange (
+	exchange_id smallint NOT NULL,
+	exchange varchar NOT NULL,
+	CONSTRAINT exchange_pk PRIMARY KEY (exchange_id),
+	CONSTRAINT exchange_uq UNIQUE (exchange)
+);
+
+INSERT INTO spot.dim_exchange (exchange_id, exchange) VALUES
+	(1, 'BYBIT'),
+	(2, 'BINANCE'),
+	(3, 'GATEIO'),
+	(4, 'KRAKEN'),
+	(5, 'OKX');
+
+CREATE TABLE spot.dim_asset (
+	coin_id integer GENERATED ALWAYS AS IDENTITY,
+	coin varchar NOT NULL,
+	CONSTRAINT asset_pk PRIMARY KEY (coin_id),
+	CONSTRAINT asset_uq UNIQUE (coin)
+);
+
+INSERT INTO spot.dim_asset (coin)
+SELECT base_coin FROM spot.dim_coin
+ UNION
+SELECT quote_coin FROM spot.dim_coin
+ UNION
+SELECT coin FROM spot.tfct_exchange_rate;
+
+ALTER TABLE spot.dim_coin
+	ADD COLUMN instrument_id integer GENERATED ALWAYS AS IDENTITY,
+	ADD COLUMN exchange_id smallint,
+	ADD COLUMN native_symbol varchar NULL,
+	ADD COLUMN base_coin_id integer,
+	ADD COLUMN quote_coin_id integer;
+
+-- native spelling is restored on the next info load, until then it mirrors symbol
+UPDATE spot.dim_coin dc
+   SET exchange_id = de.exchange_id,
+       native_symbol = dc.symbol,
+       base_coin_id = ab.coin_id,
+       quote_coin_id = aq.coin_id
+  FROM spot.dim_exchange de, spot.dim_asset ab, spot.dim_asset aq
+ WHERE de.exchange = dc.exchange
+   AND ab.coin = dc.base_coin
+   AND aq.coin = dc.quote_coin;
+
+ALTER TABLE spot.dim_coin
+	ALTER COLUMN exchange_id SET NOT NULL,
+	ALTER COLUMN base_coin_id SET NOT NULL,
+	ALTER COLUMN quote_coin_id SET NOT NULL,
+	ADD CONSTRAINT coin_instrument_uq UNIQUE (instrument_id),
+	ADD CONSTRAINT coin_exchange_fk FOREIGN KEY (exchange_id) REFERENCES spot.dim_exchange (exchange_id),
+	ADD CONSTRAINT coin_base_fk FOREIGN KEY (base_coin_id) REFERENCES spot.dim_asset (coin_id),
+	ADD CONSTRAINT coin_quote_fk FOREIGN KEY (quote_coin_id) REFERENCES spot.dim_asset (coin_id);
+
+-- fact rows without a registry entry (pairs never seen in instrument info) cannot be keyed and are dropped
+ALTER TABLE spot.tfct_coin RENAME TO tfct_coin_old;
+ALTER TABLE spot.tfct_coin_old RENAME CONSTRAINT tfct_coin_pk TO tfct_coin_old_pk;
+DROP INDEX spot.tfct_coin_oper_dt_brin;
+
+CREATE TABLE spot.tfct_coin (
+	instrument_id integer NOT NULL,
+	oper_dt date NOT NULL,
+	vol_amt double precision NULL,
+	insert_ts bigint NULL,
+	CONSTRAINT tfct_coin_pk PRIMARY KEY (instrument_id, oper_dt)
+);
+
+INSERT INTO spot.tfct_coin (instrument_id, oper_dt, vol_amt, insert_ts)
+SELECT dc.instrument_id, t.oper_dt, t.vol_amt, t.insert_ts
+  FROM spot.tfct_coin_old t
+  JOIN spot.dim_coin dc
+    ON dc.exchange = t.exchange
+   AND dc.symbol = t.symbol
+ ORDER BY t.oper_dt, dc.instrument_id;
+
+CREATE INDEX tfct_coin_oper_dt_brin ON spot.tfct_coin USING brin (oper_dt) WITH (pages_per_range = 32);
+DROP TABLE spot.tfct_coin_old;
+
+ALTER TABLE spot.tfct_exchange_rate RENAME TO tfct_exchange_rate_old;
+ALTER TABLE spot.tfct_exchange_rate_old RENAME CONSTRAINT exchange_rate_pk TO exchange_rate_old_pk;
+DROP INDEX spot.tfct_exchange_rate_oper_dt_idx;
+
+CREATE TABLE spot.tfct_exchange_rate (
+	exchange_id smallint NOT NULL,
+	coin_id integer NOT NULL,
+	oper_dt date NOT NULL,
+	usdt_amt double precision NULL,
+	insert_ts bigint NULL,
+	CONSTRAINT exchange_rate_pk PRIMARY KEY (exchange_id, coin_id, oper_dt)
+);
+
+INSERT INTO spot.tfct_exchange_rate (exchange_id, coin_id, oper_dt, usdt_amt, insert_ts)
+SELECT de.exchange_id, a.coin_id, t.oper_dt, t.usdt_amt, t.insert_ts
+  FROM spot.tfct_exchange_rate_old t
+  JOIN spot.dim_exchange de
+    ON de.exchange = t.exchange
+  JOIN spot.dim_asset a
+    ON a.coin = t.coin;
+
+CREATE INDEX tfct_exchange_rate_oper_dt_idx ON spot.tfct_exchange_rate USING btree (oper_dt);
+DROP TABLE spot.tfct_exchange_rate_old;
+
+COMMIT;
+
+ANALYZE spot.dim_coin;
+ANALYZE spot.tfct_coin;
+ANALYZE spot.tfct_exchange_rate;
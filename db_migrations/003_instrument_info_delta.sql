@@ -0,0 +1,77 @@
+-- Instrument info as change events: raw.instrument_info_state (current state per instrument) and
+-- raw.instrument_info_event (listed / delisted / status_change / changed) replace full snapshots
+-- in raw.exchange_api_instrument_info, which is no longer written.
+-- The state is seeded from the latest snapshot with instruments per exchange, so the first run after the migration
+-- logs only instruments changed since then instead of a 'listed' event for every instrument.
+
+BEGIN;
+
+CREATE TABLE raw.instrument_info_state (
+	exchange varchar NOT NULL,
+	symbol varchar NOT NULL,
+	native_symbol varchar NULL,
+	base_coin varchar NOT NULL,
+	quote_coin varchar NOT NULL,
+	trading_status varchar NOT NULL,
+	listed_ts numeric NOT NULL,
+	update_ts numeric NOT NULL,
+	CONSTRAINT instrument_info_state_pk PRIMARY KEY (exchange, symbol)
+);
+CREATE INDEX instrument_info_state_update_ts_idx ON raw.instrument_info_state (exchange, update_ts);
+
+CREATE TABLE raw.instrument_info_event (
+	exchange varchar NOT NULL,
+	symbol varchar NOT NULL,
+	event_type varchar NOT NULL,  -- listed | delisted | status_change | changed
+	native_symbol varchar NULL,
+	base_coin varchar NOT NULL,
+	quote_coin varchar NOT NULL,
+	trading_status varchar NOT NULL,
+	prev_trading_status varchar NULL,
+	insert_ts numeric NOT NULL
+);
+CREATE INDEX instrument_info_event_insert_ts_idx ON raw.instrument_info_event (exchange, insert_ts);
+
+-- instruments of every stored snapshot, flattened as RawETLoader.info_transform does (error bodies have none)
+WITH _items AS (
+	SELECT s.exchange, s.insert_ts, i.native_symbol, i.base_coin, i.quote_coin, i.trading_status
+	FROM raw.exchange_api_instrument_info s
+	CROSS JOIN LATERAL (
+		SELECT e->>'symbol', e->>'baseCoin', e->>'quoteCoin', e->>'status'
+		FROM jsonb_array_elements(CASE WHEN jsonb_typeof(s.data->'result'->'list') = 'array' THEN s.data->'result'->'list' ELSE '[]' END) e
+		WHERE s.exchange = 'BYBIT'
+		UNION ALL
+		SELECT e->>'symbol', e->>'baseAsset', e->>'quoteAsset', e->>'status'
+		FROM jsonb_array_elements(CASE WHEN jsonb_typeof(s.data->'symbols') = 'array' THEN s.data->'symbols' ELSE '[]' END) e
+		WHERE s.exchange = 'BINANCE'
+		UNION ALL
+		SELECT e->>'id', e->>'base', e->>'quote', e->>'trade_status'
+		FROM jsonb_array_elements(CASE WHEN jsonb_typeof(s.data) = 'array' THEN s.data ELSE '[]' END) e
+		WHERE s.exchange = 'GATEIO'
+		UNION ALL
+		SELECT e.key, e.value->>'base', e.value->>'quote', e.value->>'status'
+		FROM jsonb_each(CASE WHEN jsonb_typeof(s.data->'result') = 'object' THEN s.data->'result' ELSE '{}' END) e
+		WHERE s.exchange = 'KRAKEN'
+		UNION ALL
+		SELECT e->>'instId', e->>'baseCcy', e->>'quoteCcy', e->>'state'
+		FROM jsonb_array_elements(CASE WHEN jsonb_typeof(s.data->'data') = 'array' THEN s.data->'data' ELSE '[]' END) e
+		WHERE s.exchange = 'OKX'
+	) i(native_symbol, base_coin, quote_coin, trading_status)
+	WHERE i.native_symbol IS NOT NULL AND i.base_coin IS NOT NULL AND i.quote_coin IS NOT NULL AND i.trading_status IS NOT NULL
+),
+_latest AS (
+	SELECT exchange, max(insert_ts) AS insert_ts FROM _items GROUP BY exchange
+)
+INSERT INTO raw.instrument_info_state (exchange, symbol, native_symbol, base_coin, quote_coin, trading_status, listed_ts, update_ts)
+SELECT
+	i.exchange,
+	CASE i.exchange WHEN 'GATEIO' THEN replace(i.native_symbol, '_', '') WHEN 'OKX' THEN replace(i.native_symbol, '-', '') ELSE i.native_symbol END,
+	i.native_symbol, i.base_coin, i.quote_coin, i.trading_status, i.insert_ts, i.insert_ts
+FROM _items i
+JOIN _latest l ON l.exchange = i.exchange AND l.insert_ts = i.insert_ts
+ON CONFLICT (exchange, symbol) DO NOTHING;  -- symbols repeated in a snapshot keep their first row
+
+COMMIT;
+
+-- once the new tables are filled, the snapshot history can be archived and dropped:
+-- DROP TABLE raw.exchange_api_instrument_info;
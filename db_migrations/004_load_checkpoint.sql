@@ -0,0 +1,16 @@
+-- Per-symbol progress of kline loads (main.py --resume): a symbol is recorded once its klines are upserted into spot.tfct_coin.
+
+BEGIN;
+
+CREATE TABLE raw.load_checkpoint (
+	run_key varchar NOT NULL,  -- <mode>:<start_dt>
+	exchange varchar NOT NULL,
+	symbol varchar NOT NULL,
+	window_start date NOT NULL,
+	window_end date NULL,
+	rows_loaded integer NOT NULL,
+	update_ts numeric NOT NULL,
+	CONSTRAINT load_checkpoint_pk PRIMARY KEY (run_key, exchange, symbol)
+);
+
+COMMIT;
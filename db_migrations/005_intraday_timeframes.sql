@@ -0,0 +1,48 @@
+-- Intraday timeframes (main.py --time_frame 4h|1h|5m|1m), databases created before this change.
+-- raw.exchange_api_kline becomes list-partitioned by time_frame: the existing table is attached as the 'D' partition
+-- (the CHECK constraint added first lets ATTACH skip the validation scan).
+-- DM intraday facts are range-partitioned by month, partitions are created by DmETLoader.ensure_partitions on load.
+
+BEGIN;
+
+ALTER TABLE raw.exchange_api_kline RENAME TO exchange_api_kline_d;
+ALTER TABLE raw.exchange_api_kline_d ADD CONSTRAINT exchange_api_kline_d_tf_chk CHECK (time_frame IS NOT NULL AND time_frame = 'D');
+
+CREATE TABLE raw.exchange_api_kline (
+	exchange varchar NOT NULL,
+	symbol varchar NULL,
+	time_frame varchar NOT NULL,
+	insert_ts numeric NOT NULL,
+	"data" jsonb NULL
+) PARTITION BY LIST (time_frame);
+
+ALTER TABLE raw.exchange_api_kline ATTACH PARTITION raw.exchange_api_kline_d FOR VALUES IN ('D');
+ALTER TABLE raw.exchange_api_kline_d DROP CONSTRAINT exchange_api_kline_d_tf_chk;
+
+CREATE TABLE raw.exchange_api_kline_4h PARTITION OF raw.exchange_api_kline FOR VALUES IN ('4h');
+CREATE TABLE raw.exchange_api_kline_1h PARTITION OF raw.exchange_api_kline FOR VALUES IN ('1h');
+CREATE TABLE raw.exchange_api_kline_5m PARTITION OF raw.exchange_api_kline FOR VALUES IN ('5m');
+CREATE TABLE raw.exchange_api_kline_1m PARTITION OF raw.exchange_api_kline FOR VALUES IN ('1m');
+
+CREATE TABLE spot.tfct_coin_intraday (
+	instrument_id integer NOT NULL,
+	time_frame varchar(3) NOT NULL,
+	oper_ts timestamp NOT NULL,
+	vol_amt double precision NULL,
+	insert_ts bigint NULL,
+	CONSTRAINT tfct_coin_intraday_pk PRIMARY KEY (instrument_id, time_frame, oper_ts)
+) PARTITION BY RANGE (oper_ts);
+
+CREATE INDEX tfct_coin_intraday_oper_ts_brin ON spot.tfct_coin_intraday USING brin (oper_ts) WITH (pages_per_range = 32);
+
+CREATE TABLE spot.tfct_exchange_rate_intraday (
+	exchange_id smallint NOT NULL,
+	coin_id integer NOT NULL,
+	time_frame varchar(3) NOT NULL,
+	oper_ts timestamp NOT NULL,
+	usdt_amt double precision NULL,
+	insert_ts bigint NULL,
+	CONSTRAINT exchange_rate_intraday_pk PRIMARY KEY (exchange_id, coin_id, time_frame, oper_ts)
+) PARTITION BY RANGE (oper_ts);
+
+COMMIT;
@@ -0,0 +1,27 @@
+-- Task queue of distributed kline fetching (python_scripts/worker.py).
+
+BEGIN;
+
+-- kline fetch tasks of distributed runs (worker.py), claimed by workers with FOR UPDATE SKIP LOCKED
+CREATE TABLE raw.kline_task (
+	task_id bigint GENERATED ALWAYS AS IDENTITY,
+	run_key varchar NOT NULL,  -- <mode>:<start_dt>
+	exchange varchar NOT NULL,
+	symbol varchar NOT NULL,  -- exchange's native symbol
+	time_frame varchar NOT NULL,
+	window_start timestamp NOT NULL,
+	window_end timestamp NULL,
+	status varchar NOT NULL,  -- pending | running | done | failed
+	attempts integer NOT NULL,
+	worker varchar NULL,
+	claimed_ts numeric NULL,
+	update_ts numeric NOT NULL,
+	error varchar NULL,
+	CONSTRAINT kline_task_pk PRIMARY KEY (task_id),
+	CONSTRAINT kline_task_uq UNIQUE (run_key, exchange, symbol, time_frame, window_start)
+);
+
+-- claims scan open tasks only
+CREATE INDEX kline_task_open_idx ON raw.kline_task USING btree (task_id) WHERE status IN ('pending', 'running');
+
+COMMIT;
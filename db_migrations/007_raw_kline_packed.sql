@@ -0,0 +1,15 @@
+-- Packed raw klines (python_scripts --raw_format packed): the used candle fields of every response are stored
+-- next to it in candles (bytea, little-endian int64 open time + float64 open, volume, amount per candle, see
+-- RawETLoader.kline_packed_dtype), so kline_read decodes them without JSON parsing. The response itself is kept
+-- for audit, TOAST-compressed with LZ4 instead of pglz (faster to compress and to detoast on scans).
+-- Rows stored before keep pglz-compressed data without candles and are read through the JSON path.
+
+BEGIN;
+
+ALTER TABLE raw.exchange_api_kline ADD COLUMN candles bytea NULL;
+
+-- packed floats do not compress, store them out of line without a compression attempt
+ALTER TABLE raw.exchange_api_kline ALTER COLUMN candles SET STORAGE EXTERNAL;
+ALTER TABLE raw.exchange_api_kline ALTER COLUMN "data" SET COMPRESSION lz4;
+
+COMMIT;
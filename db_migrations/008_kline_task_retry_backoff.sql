@@ -0,0 +1,4 @@
+-- Retry backoff of the kline task queue (python_scripts/worker.py, databases created before this change):
+-- a failed task is not claimed again before not_before, which grows with its attempts.
+
+ALTER TABLE raw.kline_task ADD COLUMN IF NOT EXISTS not_before numeric NULL;
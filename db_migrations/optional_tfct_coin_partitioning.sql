@@ -0,0 +1,40 @@
+-- Optional: convert spot.tfct_coin into a table range-partitioned by oper_dt (one partition per year).
+-- Worth it once the table reaches tens of millions of rows: date-range scans prune whole partitions
+-- and old years can be detached/archived cheaply. Apply after 002_instrument_registry.sql.
+
+BEGIN;
+
+ALTER TABLE spot.tfct_coin RENAME TO tfct_coin_unpartitioned;
+ALTER TABLE spot.tfct_coin_unpartitioned RENAME CONSTRAINT tfct_coin_pk TO tfct_coin_unpartitioned_pk;
+ALTER INDEX spot.tfct_coin_oper_dt_brin RENAME TO tfct_coin_unpartitioned_oper_dt_brin;
+
+CREATE TABLE spot.tfct_coin (
+	instrument_id integer NOT NULL,
+	oper_dt date NOT NULL,
+	vol_amt double precision NULL,
+	insert_ts bigint NULL,
+	CONSTRAINT tfct_coin_pk PRIMARY KEY (instrument_id, oper_dt)
+) PARTITION BY RANGE (oper_dt);
+
+CREATE INDEX tfct_coin_oper_dt_brin ON spot.tfct_coin USING brin (oper_dt) WITH (pages_per_range = 32);
+
+DO $$
+DECLARE
+	y int;
+BEGIN
+	FOR y IN 2024 .. extract(year from current_date)::int + 1 LOOP
+		EXECUTE format(
+			'CREATE TABLE spot.tfct_coin_y%s PARTITION OF spot.tfct_coin FOR VALUES FROM (%L) TO (%L)',
+			y, make_date(y, 1, 1), make_date(y + 1, 1, 1)
+		);
+	END LOOP;
+END $$;
+
+CREATE TABLE spot.tfct_coin_default PARTITION OF spot.tfct_coin DEFAULT;
+
+INSERT INTO spot.tfct_coin SELECT * FROM spot.tfct_coin_unpartitioned ORDER BY oper_dt, instrument_id;
+DROP TABLE spot.tfct_coin_unpartitioned;
+
+COMMIT;
+
+ANALYZE spot.tfct_coin;
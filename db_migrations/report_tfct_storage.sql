@@ -0,0 +1,50 @@
+-- Size and dashboard-style date-range scan report for the DM fact tables.
+-- Set the range with: psql -v from_dt="'2025-01-01'" -v to_dt="'2025-02-01'" -f report_tfct_storage.sql
+\if :{?from_dt}
+\else
+\set from_dt '''2025-01-01'''
+\endif
+\if :{?to_dt}
+\else
+\set to_dt '''2025-02-01'''
+\endif
+
+select c.relname as tbl_name,
+       c.reltuples::bigint as est_rows,
+       pg_size_pretty(pg_table_size(c.oid)) as table_size,
+       pg_size_pretty(pg_indexes_size(c.oid)) as indexes_size,
+       pg_size_pretty(pg_total_relation_size(c.oid)) as total_size,
+       round(pg_table_size(c.oid)::numeric / nullif(c.reltuples, 0)::numeric, 1) as bytes_per_row
+  from pg_class c
+  join pg_namespace n
+    on n.oid = c.relnamespace
+ where n.nspname = 'spot'
+   and c.relname in ('tfct_coin', 'tfct_exchange_rate')
+ order by c.relname;
+
+\timing on
+
+-- same shape as the COIN_VOLUME dataset of the spot-trade dashboard
+explain (analyze, buffers)
+select dc.exchange, dc.symbol, tc.oper_dt, tc.vol_amt * coalesce(ter.usdt_amt, 1.0) as vol_usdt
+  from spot.tfct_coin tc
+  join spot.dim_coin dc
+    on tc.instrument_id = dc.instrument_id
+  left join spot.tfct_exchange_rate ter
+    on dc.quote_coin_id = ter.coin_id
+   and dc.quote_coin <> 'USDT'
+   and tc.oper_dt = ter.oper_dt
+   and dc.exchange_id = ter.exchange_id
+ where tc.oper_dt >= :from_dt
+   and tc.oper_dt < :to_dt;
+
+explain (analyze, buffers)
+select dc.exchange, sum(tc.vol_amt)
+  from spot.tfct_coin tc
+  join spot.dim_coin dc
+    on tc.instrument_id = dc.instrument_id
+ where tc.oper_dt >= :from_dt
+   and tc.oper_dt < :to_dt
+ group by dc.exchange;
+
+\timing off
@@ -0,0 +1,75 @@
+"""
+Benchmark of ccyconv.rates_process on synthetic pairs.
+
+    python -m benchmarks.bench_ccyconv --coins 3000 --days 300
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from ccyconv import rates_process
+
+
+def synthetic_pairs(n_coins: int, n_days: int, seed: int = 0, listing_changes: int = 0) -> pd.DataFrame:
+    """
+    Pairs of n_coins listed every day for n_days: ~half quoted in USDT, the rest in a hub coin
+    or in another alt (multi-hop chains), with a random walk price per pair.
+    listing_changes pairs get listed at a random day (topology changes).
+    """
+    rng = np.random.default_rng(seed)
+    hubs = ['USDT', 'BTC', 'ETH', 'EUR', 'TRY']
+    coins = hubs + [f'C{i}' for i in range(n_coins - len(hubs))]
+    base, quote = ['BTC', 'ETH', 'USDT', 'USDT'], ['USDT', 'BTC', 'EUR', 'TRY']
+    for i, coin in enumerate(coins[len(hubs):], start=len(hubs)):
+        r = rng.random()
+        base.append(coin)
+        quote.append('USDT' if r < 0.5 else hubs[1 + int(r * 10) % 4] if r < 0.85 else coins[rng.integers(len(hubs), i)] if i > len(hubs) else 'USDT')
+    n_pairs = len(base)
+    symbols = [b + q for b, q in zip(base, quote)]
+    prices = np.exp(rng.normal(0, 3, n_pairs))[None, :] * np.exp(np.cumsum(rng.normal(0, 0.02, (n_days, n_pairs)), axis=0))
+    dates = pd.date_range('2025-01-01', periods=n_days, freq='D')
+    df_pairs = pd.DataFrame({
+        'oper_dt': np.repeat(dates, n_pairs),
+        'base_coin': np.tile(base, n_days),
+        'quote_coin': np.tile(quote, n_days),
+        'symbol': np.tile(symbols, n_days),
+        'price_avg': prices.ravel(),
+    })
+    if listing_changes:
+        listed_from = pd.Series(dates[rng.integers(0, n_days, listing_changes)], index=rng.choice(symbols[4:], listing_changes, replace=False))
+        df_pairs = df_pairs[~(df_pairs['oper_dt'] < df_pairs['symbol'].map(listed_from))].reset_index(drop=True)
+    return df_pairs
+
+
+def run(n_coins: int, n_days: int, repeat: int = 3, listing_changes: int = 0) -> dict:
+    df_pairs = synthetic_pairs(n_coins, n_days, listing_changes=listing_changes)
+    targets = pd.unique(pd.concat([df_pairs['base_coin'], df_pairs['quote_coin']])).tolist()
+    timings = []
+    for _ in range(repeat):
+        path_cache = {}
+        t0 = time.perf_counter()
+        df_rate = rates_process(df_pairs, targets, goal_coin='USDT', path_cache=path_cache)
+        timings.append(time.perf_counter() - t0)
+    return {
+        'coins': n_coins,
+        'days': n_days,
+        'listing_changes': listing_changes,
+        'pairs': len(df_pairs),
+        'rates': len(df_rate),
+        'found_share': float(df_rate['conversion_path'].notnull().mean()),
+        'path_searches': len(path_cache),
+        'best_s': min(timings),
+        'median_s': float(np.median(timings)),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--coins', nargs='*', type=int, default=[100, 1000, 3000])
+    parser.add_argument('--days', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--listing_changes', type=int, default=0)
+    namespace = parser.parse_args()
+    for n_coins in namespace.coins:
+        print(run(n_coins, namespace.days, namespace.repeat, namespace.listing_changes))
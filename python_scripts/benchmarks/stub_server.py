@@ -0,0 +1,172 @@
+"""
+Local HTTP stub of the five exchange APIs serving synthetic payloads (benchmarks/synthetic.py).
+Routes /<EXCHANGE><endpoint>, e.g. /BYBIT/v5/market/kline?symbol=BTCUSDT&start=...;
+patch_exchange_urls() points the Exchange classes to it.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import argparse
+import datetime
+import json
+import threading
+import time
+import zlib
+import pandas as pd
+
+from benchmarks import synthetic
+from exchange import Bybit, Binance, Gateio, Kraken, Okx, TIME_FRAMES
+
+
+exchange_class_dict = {cls.name: cls for cls in (Bybit, Binance, Gateio, Kraken, Okx)}
+# kline request parameters: symbol, interval, lower and upper bound of the range and their unit (ms / s)
+kline_param_dict = {
+    'BYBIT': ('symbol', 'interval', 'start', 'end', 1000),
+    'BINANCE': ('symbol', 'interval', 'startTime', 'endTime', 1000),
+    'GATEIO': ('currency_pair', 'interval', 'from', 'to', 1),
+    'KRAKEN': ('pair', 'interval', 'since', None, 1),
+    'OKX': ('instId', 'bar', 'before', 'after', 1000),
+}
+# OHLC of Kraken returns the last 720 candles at most
+KRAKEN_MAX_CANDLES: int = 720
+
+
+class StubExchangeServer:
+    """
+    Serves info for n_symbols instruments and n_days of candles (of every timeframe in TIME_FRAMES) per symbol of every exchange,
+    optional latency (seconds) is added to each response
+    """
+    n_symbols: int
+    n_days: int
+    latency: float
+
+    def __init__(self, n_symbols: int = 100, n_days: int = 30, latency: float = 0.0, seed: int = 0, port: int = 0) -> None:
+        self.n_symbols = n_symbols
+        self.n_days = n_days
+        self.latency = latency
+        self.seed = seed
+        self.info_dict = {exchange_type: synthetic.info_payload(exchange_type, n_symbols, seed) for exchange_type in exchange_class_dict}
+        self.candle_dict: dict = {}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.thread: threading.Thread | None = None
+
+
+    @property
+    def url(self) -> str:
+        return 'http://{}:{}'.format(*self.httpd.server_address)
+
+
+    def get_candles(self, exchange_type: str, symbol: str, time_frame: str = 'D') -> pd.DataFrame:
+        with self._lock:
+            if (exchange_type, symbol, time_frame) not in self.candle_dict:
+                self.candle_dict[(exchange_type, symbol, time_frame)] = synthetic.candles(
+                    self.n_days, seed=zlib.crc32(f'{self.seed}:{symbol}'.encode()), tf_sec=TIME_FRAMES[time_frame]
+                )
+            return self.candle_dict[(exchange_type, symbol, time_frame)]
+
+
+    def respond(self, path: str, query: dict) -> tuple:
+        """
+        Returns (status, payload, headers) for the request path
+        """
+        exchange_type, _, endpoint = path.lstrip('/').partition('/')
+        exchange_cls = exchange_class_dict.get(exchange_type)
+        if exchange_cls is None:
+            return 404, {'error': f'unknown exchange {exchange_type}'}, {}
+        # Date header is sent by BaseHTTPRequestHandler.send_response
+        headers = {'X-Out-Time': str(int(time.time() * 1e6))}
+        endpoint = '/' + endpoint.lstrip('/')
+        if endpoint == '/' + exchange_cls.endpoint_dict['info'].lstrip('/'):
+            return 200, self.info_dict[exchange_type], headers
+        elif endpoint in {'/' + exchange_cls.endpoint_dict[key].lstrip('/') for key in ('kline', 'kline_history') if key in exchange_cls.endpoint_dict}:
+            symbol_param, interval_param, start_param, end_param, unit = kline_param_dict[exchange_type]
+            symbol = query.get(symbol_param, [''])[0]
+            time_frame = {val: key for key, val in exchange_cls.interval_dict.items()}.get(query.get(interval_param, [''])[0])
+            if time_frame is None:
+                return 400, {'error': f'unknown interval {query.get(interval_param)}'}, headers
+            df_candle = self.get_candles(exchange_type, symbol, time_frame)
+            # bounds of OKX are exclusive
+            exclusive = exchange_type == 'OKX'
+            if start_param in query:
+                start_ts = int(query[start_param][0]) / unit
+                df_candle = df_candle[df_candle['ts'] > start_ts] if exclusive else df_candle[df_candle['ts'] >= start_ts]
+            if end_param in query:
+                end_ts = int(query[end_param][0]) / unit
+                df_candle = df_candle[df_candle['ts'] < end_ts] if exclusive else df_candle[df_candle['ts'] <= end_ts]
+            if 'limit' in query:
+                df_candle = df_candle.tail(int(query['limit'][0]))
+            if exchange_type == 'KRAKEN':
+                df_candle = df_candle.tail(KRAKEN_MAX_CANDLES)
+            return 200, synthetic.kline_payload(exchange_type, symbol, df_candle, TIME_FRAMES[time_frame]), headers
+        return 404, {'error': f'unknown endpoint {endpoint}'}, headers
+
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                split = urlsplit(self.path)
+                status, payload, headers = server.respond(split.path, parse_qs(split.query))
+                if server.latency:
+                    time.sleep(server.latency)
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for key, val in headers.items():
+                    self.send_header(key, val)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        return Handler
+
+
+    def start(self) -> 'StubExchangeServer':
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='stub-exchange-server', daemon=True)
+        self.thread.start()
+        return self
+
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+    def __enter__(self) -> 'StubExchangeServer':
+        return self.start()
+
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def patch_exchange_urls(base_url: str) -> dict:
+    """
+    Points Exchange classes to base_url/<EXCHANGE>, returns the original urls for restore_exchange_urls
+    """
+    original_dict = {name: cls.url for name, cls in exchange_class_dict.items()}
+    for name, cls in exchange_class_dict.items():
+        cls.url = f'{base_url}/{name}'
+    return original_dict
+
+
+def restore_exchange_urls(original_dict: dict) -> None:
+    for name, url in original_dict.items():
+        exchange_class_dict[name].url = url
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--symbols', nargs='?', default=100, type=int)
+    parser.add_argument('-n', '--days', nargs='?', default=30, type=int)
+    parser.add_argument('-p', '--port', nargs='?', default=8099, type=int)
+    parser.add_argument('-l', '--latency', nargs='?', default=0.0, type=float)
+    namespace = parser.parse_args()
+
+    stub = StubExchangeServer(namespace.symbols, namespace.days, namespace.latency, port=namespace.port)
+    print(f'Info: stub exchange API on {stub.url} since {datetime.datetime.now()}')
+    stub.httpd.serve_forever()
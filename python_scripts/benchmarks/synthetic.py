@@ -0,0 +1,132 @@
+"""
+Synthetic API payloads in the native formats of the five exchanges, at configurable scale (symbols x days).
+Payloads have the same shape as the responses stored in the raw layer, so they go through
+RawETLoader.kline_transform / info_transform (and the stub HTTP server) unchanged.
+"""
+import calendar
+import datetime
+import time
+import numpy as np
+import pandas as pd
+
+
+EXCHANGE_LIST = ['BYBIT', 'BINANCE', 'GATEIO', 'KRAKEN', 'OKX']
+QUOTE_LIST = ['USDT', 'USDT', 'USDT', 'USDC', 'BTC', 'ETH', 'EUR', 'TRY']
+
+
+def native_symbol(exchange_type: str, base: str, quote: str) -> str:
+    if exchange_type == 'GATEIO':
+        return f'{base}_{quote}'
+    elif exchange_type == 'OKX':
+        return f'{base}-{quote}'
+    return f'{base}{quote}'
+
+
+def instrument_list(n_symbols: int, seed: int = 0) -> list:
+    """
+    [(base, quote), ...] of n_symbols spot pairs: quote coins of each hub are listed against USDT,
+    the rest are alts quoted mostly in USDT
+    """
+    rng = np.random.default_rng(seed)
+    pairs = [('BTC', 'USDT'), ('ETH', 'USDT'), ('ETH', 'BTC'), ('USDC', 'USDT'), ('EUR', 'USDT'), ('USDT', 'TRY')]
+    i = 0
+    while len(pairs) < n_symbols:
+        pairs.append((f'COIN{i}', QUOTE_LIST[rng.integers(len(QUOTE_LIST))]))
+        i += 1
+    return pairs[:n_symbols]
+
+
+def info_payload(exchange_type: str, n_symbols: int, seed: int = 0) -> dict | list:
+    pairs = instrument_list(n_symbols, seed)
+    if exchange_type == 'BYBIT':
+        return {'retCode': 0, 'retMsg': 'OK', 'result': {'category': 'spot', 'list': [
+            {'symbol': native_symbol(exchange_type, b, q), 'baseCoin': b, 'quoteCoin': q, 'status': 'Trading'} for b, q in pairs
+        ]}, 'retExtInfo': {}, 'time': int(datetime.datetime.now().timestamp() * 1000)}
+    elif exchange_type == 'BINANCE':
+        return {'timezone': 'UTC', 'serverTime': int(datetime.datetime.now().timestamp() * 1000), 'symbols': [
+            {'symbol': native_symbol(exchange_type, b, q), 'status': 'TRADING', 'baseAsset': b, 'quoteAsset': q} for b, q in pairs
+        ]}
+    elif exchange_type == 'GATEIO':
+        return [{'id': native_symbol(exchange_type, b, q), 'base': b, 'quote': q, 'trade_status': 'tradable'} for b, q in pairs]
+    elif exchange_type == 'KRAKEN':
+        return {'error': [], 'result': {
+            native_symbol(exchange_type, b, q): {'altname': native_symbol(exchange_type, b, q), 'base': b, 'quote': q, 'status': 'online'} for b, q in pairs
+        }}
+    elif exchange_type == 'OKX':
+        return {'code': '0', 'msg': '', 'data': [
+            {'instId': native_symbol(exchange_type, b, q), 'baseCcy': b, 'quoteCcy': q, 'state': 'live'} for b, q in pairs
+        ]}
+    raise ValueError(exchange_type)
+
+
+def candles(n_days: int, end_dt: datetime.date | None = None, seed: int = 0, tf_sec: int = 86400) -> pd.DataFrame:
+    """
+    OHLCV random walk of n_days worth of tf_sec candles ending at end_dt (the last closed candle by default):
+    ts (epoch s), open, high, low, close, volume (base), turnover (quote)
+    """
+    rng = np.random.default_rng(seed)
+    n = n_days * 86400 // tf_sec
+    end_ts = calendar.timegm(end_dt.timetuple()) if end_dt else int(time.time()) // tf_sec * tf_sec - tf_sec
+    close = np.exp(rng.normal(0, 3)) * np.exp(np.cumsum(rng.normal(0, 0.03 * np.sqrt(tf_sec / 86400), n)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(open_, close) * (1 + rng.random(n) * 0.02)
+    low = np.minimum(open_, close) * (1 - rng.random(n) * 0.02)
+    volume = rng.lognormal(8, 2, n) * tf_sec / 86400
+    return pd.DataFrame({
+        'ts': end_ts - tf_sec * np.arange(n)[::-1],
+        'open': open_, 'high': high, 'low': low, 'close': close,
+        'volume': volume, 'turnover': volume * (open_ + close) / 2,
+    })
+
+
+def kline_payload(exchange_type: str, symbol: str, df_candle: pd.DataFrame, tf_sec: int = 86400) -> dict | list:
+    """
+    Candles of one symbol in the exchange's kline response format (newest first where the exchange does so)
+    """
+    fmt = lambda arr: [f'{v:.8g}' for v in arr]
+    ts, o, h, l, c, v, t = (df_candle[col].to_numpy() for col in ['ts', 'open', 'high', 'low', 'close', 'volume', 'turnover'])
+    if exchange_type == 'BYBIT':
+        rows = [list(r) for r in zip([str(x * 1000) for x in ts], fmt(o), fmt(h), fmt(l), fmt(c), fmt(v), fmt(t))][::-1]
+        return {'retCode': 0, 'retMsg': 'OK', 'result': {'symbol': symbol, 'category': 'spot', 'list': rows}, 'retExtInfo': {}, 'time': int(ts[-1]) * 1000}
+    elif exchange_type == 'BINANCE':
+        return [
+            [int(x) * 1000, *r, int(x) * 1000 + tf_sec * 1000 - 1, tt, 1000, vv, tt, '0']
+            for x, r, vv, tt in zip(ts, zip(fmt(o), fmt(h), fmt(l), fmt(c), fmt(v)), fmt(v / 2), fmt(t))
+        ]
+    elif exchange_type == 'GATEIO':
+        return [list(r) for r in zip([str(x) for x in ts], fmt(t), fmt(c), fmt(h), fmt(l), fmt(o), fmt(v), ['true'] * len(ts))]
+    elif exchange_type == 'KRAKEN':
+        vwap = t / v
+        return {'error': [], 'result': {
+            symbol: [list(r) for r in zip([int(x) for x in ts], fmt(o), fmt(h), fmt(l), fmt(c), fmt(vwap), fmt(v), [1000] * len(ts))],
+            'last': int(ts[-1])
+        }}
+    elif exchange_type == 'OKX':
+        rows = [list(r) for r in zip([str(x * 1000) for x in ts], fmt(o), fmt(h), fmt(l), fmt(c), fmt(v), fmt(t), fmt(t), ['1'] * len(ts))][::-1]
+        return {'code': '0', 'msg': '', 'data': rows}
+    raise ValueError(exchange_type)
+
+
+def raw_kline_frame(exchange_type: str, n_symbols: int, n_days: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Rows of raw.exchange_api_kline (exchange, symbol, time_frame, insert_ts, data) for n_symbols x n_days
+    """
+    insert_ts = int(datetime.datetime.now().timestamp() * 1000)
+    rows = []
+    for i, (base, quote) in enumerate(instrument_list(n_symbols, seed)):
+        symbol = native_symbol(exchange_type, base, quote)
+        stored_symbol = symbol.replace('_', '').replace('-', '')
+        rows.append((exchange_type, stored_symbol, 'D', insert_ts, kline_payload(exchange_type, symbol, candles(n_days, seed=seed * 100003 + i))))
+    return pd.DataFrame(rows, columns=['exchange', 'symbol', 'time_frame', 'insert_ts', 'data'])
+
+
+def raw_info_frame(exchange_type: str, n_symbols: int, n_snapshots: int = 1, seed: int = 0) -> pd.DataFrame:
+    """
+    Instrument info responses as RawETLoader.info_transform takes them (exchange, insert_ts, data), n_snapshots daily snapshots
+    """
+    insert_ts = int(datetime.datetime.now().timestamp() * 1000)
+    payload = info_payload(exchange_type, n_symbols, seed)
+    return pd.DataFrame(
+        [(exchange_type, insert_ts - 86400000 * i, payload) for i in range(n_snapshots)],
+        columns=['exchange', 'insert_ts', 'data']
+    )
@@ -1,106 +1,261 @@
-from collections import defaultdict
-import datetime
+import time
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
+from metrics import metrics
 
 
-def build_graph_per_date(df_pairs: pd.DataFrame, target_date: datetime.datetime) -> defaultdict:
-    df_date = df_pairs[df_pairs['oper_dt'] == target_date]
-    graph = defaultdict(list)
-    for _, row in df_date.iterrows():
-        base = row['base_coin']
-        quote = row['quote_coin']
-        symbol = row['symbol']
-        price = row['price_avg']
-        graph[base].append({'coin': quote, 'symbol': symbol, 'price': price})
-        # Reverse conversions (inverse rate)
-        graph[quote].append({'coin': base, 'symbol': symbol, 'price': 1.0 / price})
-    return graph
+def build_graph_per_date(base_idx: np.ndarray, quote_idx: np.ndarray, price: np.ndarray, n_coins: int) -> tuple:
+    """
+    Builds an integer-indexed adjacency (CSR) of one date's pairs.
+    Every pair i gives an edge base -> quote with rate price[i] and the reverse edge quote -> base with rate 1 / price[i].
+    Returns a tuple: (indptr, dst, pair, rate)
+      - edges of coin c are indptr[c]:indptr[c + 1]
+      - dst: destination coin of the edge
+      - pair: row index of the pair the edge came from (to recover its symbol)
+      - rate: 1 unit of source coin equals rate units of destination coin
+    """
+    n_pairs = len(base_idx)
+    src = np.concatenate([base_idx, quote_idx])
+    dst = np.concatenate([quote_idx, base_idx])
+    pair = np.concatenate([np.arange(n_pairs), np.arange(n_pairs)])
+    with np.errstate(divide='ignore'):
+        rate = np.concatenate([price, 1.0 / price])
+    order = np.argsort(src, kind='stable')
+    indptr = np.zeros(n_coins + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n_coins), out=indptr[1:])
+    return indptr, dst[order], pair[order], rate[order]
 
 
-def find_path(graph: defaultdict, start_coin: str, goal_coin: str) -> tuple:
+def search_from_goal(graph: tuple, goal_idx: int) -> tuple:
     """
-    Finds a conversion chain from start_coin to goal_coin within the provided graph.
-    It returns a tuple: (path, conversion_factor)
-      - path: list of tuples (from_coin, to_coin, symbol)
-      - conversion_factor: overall factor such that 1 unit of start_coin equals
-                           conversion_factor units of goal_coin.
-    Returns (None, None) if no path is found.
+    Single breadth-first search from goal_idx over the graph, one frontier level at a time.
+    Since every edge has its inverse, walking out of the goal finds the fewest-hops chain
+    towards the goal for every reachable coin at once.
+    Returns a tuple: (parent, via, factor)
+      - parent: next coin on the chain towards the goal (-1 for the goal and unreachable coins)
+      - via: pair index used for that hop
+      - factor: 1 unit of the coin equals factor units of goal coin (NaN if unreachable)
     """
-    reachable = set([start_coin])
-    cost = {start_coin: 0}            # Number of hops (each conversion = 1 hop)
-    conv_factor = {start_coin: 1.0}     # Cumulative conversion factor
-    previous = {}                     # For backtracking the path
-    came_via = {}                     # Maps coin -> (symbol, price) used for conversion
-
-    while reachable:
-        # Select the coin with the lowest hop count.
-        current = min(reachable, key=lambda coin: cost[coin])
-        if current == goal_coin:
-            path = build_path(previous, came_via, current)
-            return path, conv_factor[current]
-        
-        reachable.remove(current)
-        for edge in graph.get(current, []):
-            neighbor = edge['coin']
-            new_cost = cost[current] + 1
-            new_conv = conv_factor[current] * edge['price']
-            if neighbor not in cost or new_cost < cost[neighbor]:
-                cost[neighbor] = new_cost
-                conv_factor[neighbor] = new_conv
-                previous[neighbor] = current
-                came_via[neighbor] = (edge['symbol'], edge['price'])
-                reachable.add(neighbor)
-    return None, None
-
-
-def build_path(previous: dict, came_via: dict, current: str) -> list:
+    indptr, dst, pair, rate = graph
+    n_coins = len(indptr) - 1
+    parent = np.full(n_coins, -1, dtype=np.int64)
+    via = np.full(n_coins, -1, dtype=np.int64)
+    factor = np.full(n_coins, np.nan)
+    visited = np.zeros(n_coins, dtype=bool)
+    factor[goal_idx], visited[goal_idx] = 1.0, True
+
+    frontier = np.array([goal_idx], dtype=np.int64)
+    while frontier.size:
+        starts = indptr[frontier]
+        counts = indptr[frontier + 1] - starts
+        total = counts.sum()
+        if not total:
+            break
+        edge = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+        coin_from = np.repeat(frontier, counts)
+        coin_to = dst[edge]
+        mask = ~visited[coin_to]
+        coin_from, coin_to, edge = coin_from[mask], coin_to[mask], edge[mask]
+        # one parent per newly reached coin
+        coin_to, first = np.unique(coin_to, return_index=True)
+        coin_from, edge = coin_from[first], edge[first]
+
+        visited[coin_to] = True
+        parent[coin_to] = coin_from
+        via[coin_to] = pair[edge]
+        # 1 coin_to = 1 / rate(coin_from -> coin_to) coin_from
+        factor[coin_to] = factor[coin_from] / rate[edge]
+        frontier = coin_to
+    return parent, via, factor
+
+
+def search_tree(base_idx: np.ndarray, quote_idx: np.ndarray, coins: list, symbols: list, goal_idx: int) -> dict:
+    """
+    Runs one search from goal_idx over a topology (prices are irrelevant for the chain itself)
+    and returns its tree: coin -> (next_coin, symbol, exponent), where 1 coin = price(symbol) ** exponent next_coin.
+    Only names are stored, so a tree stays valid for any date (or call) with the same set of symbols.
+    """
+    graph = build_graph_per_date(base_idx, quote_idx, np.ones(len(base_idx)), len(coins))
+    parent, via, _ = search_from_goal(graph, goal_idx)
+    tree = {}
+    for coin_idx in np.flatnonzero(parent >= 0).tolist():
+        pair_idx = int(via[coin_idx])
+        tree[coins[coin_idx]] = (coins[parent[coin_idx]], symbols[pair_idx], 1 if base_idx[pair_idx] == coin_idx else -1)
+    return tree
+
+
+def build_path(tree: dict, coin: str) -> list:
     """
-    Reconstructs the conversion chain (as a list of (from_coin, to_coin, symbol) tuples)
-    from the start coin to the current (goal) coin.
+    Reconstructs the conversion chain (as a list of (from_coin, to_coin, symbol, exponent) tuples)
+    from coin to the root (goal coin) of the tree.
     """
     path = []
-    while current in previous:
-        prev = previous[current]
-        symbol, _ = came_via[current]
-        path.append((prev, current, symbol))
-        current = prev
-    path.reverse()
+    while coin in tree:
+        next_coin, symbol, exponent = tree[coin]
+        path.append((coin, next_coin, symbol, exponent))
+        coin = next_coin
     return path
 
 
-def convert_to_usdt(graph: defaultdict, data_targets: list, goal_coin='USDT') -> pd.DataFrame:
+def rates_process(df_pairs: pd.DataFrame, df_targets: list, goal_coin: str = 'USDT', path_cache: dict | None = None) -> pd.DataFrame:
     """
-    For each coin in df_targets, finds a conversion chain from that coin to goal_coin.
+    For each oper_dt in df_pairs finds a conversion chain from every coin in df_targets to goal_coin.
+    Chains depend only on the set of listed symbols, so dates are grouped by that topology: one search
+    per distinct topology, then conversion factors of the whole group are a vectorised product of its prices.
+    path_cache (goal_coin, frozenset of symbols) -> search tree may be shared between calls.
     Returns a DataFrame with:
       - coin
-      - conversion_path: list of (from_coin, to_coin, symbol) tuples
-      - price_in_usdt: overall conversion factor (1 coin = price_in_usdt USDT)
+      - conversion_path: list of (from_coin, to_coin, symbol) tuples (None if not found)
+      - usdt_amt: overall conversion factor (1 coin = usdt_amt USDT, NaN if not found)
+      - oper_dt
     """
-    df_targets = pd.DataFrame({'coin': data_targets})
+    t0 = time.perf_counter()
+    path_cache = {} if path_cache is None else path_cache
+    df_pairs = df_pairs.drop_duplicates(['oper_dt', 'symbol'])
+    dt_codes, dts = pd.factorize(df_pairs['oper_dt'])
+    symbol_codes, symbol_names = pd.factorize(df_pairs['symbol'])
+    symbol_names = list(symbol_names)
+    prices = df_pairs['price_avg'].to_numpy(dtype='float64')
+
+    # rows sorted by (date, symbol): each date's symbol codes form its topology key
+    order = np.lexsort((symbol_codes, dt_codes))
+    dt_bounds = np.searchsorted(dt_codes[order], np.arange(len(dts) + 1))
+    topology_dates: dict = {}
+    for dt_code in range(len(dts)):
+        topology_dates.setdefault(symbol_codes[order[dt_bounds[dt_code]:dt_bounds[dt_code + 1]]].tobytes(), []).append(dt_code)
+
     results = []
-    for _, row in df_targets.iterrows():
-        coin = row['coin']
-        if coin == goal_coin:
-            results.append({
-                'coin': coin,
-                'conversion_path': [],
-                'usdt_amt': 1.0
-            })
-        else:
-            path, conv = find_path(graph, coin, goal_coin)
-            results.append({
-                'coin': coin,
-                'conversion_path': path,
-                'usdt_amt': conv
-            })
-    return pd.DataFrame(results)
-
-
-def rates_process(df_pairs: pd.DataFrame, df_targets: list, goal_coin: str = 'USDT') -> pd.DataFrame:
-    results_by_date = []
-    for oper_dt in df_pairs['oper_dt'].unique():
-        graph = build_graph_per_date(df_pairs, oper_dt)
-        df_conv = convert_to_usdt(graph, df_targets, goal_coin)
-        df_conv['oper_dt'] = oper_dt
-        results_by_date.append(df_conv)
-    return pd.concat(results_by_date, ignore_index=True)
\ No newline at end of file
+    for dt_code_list in topology_dates.values():
+        first_rows = order[dt_bounds[dt_code_list[0]]:dt_bounds[dt_code_list[0] + 1]]
+        topology = symbol_codes[first_rows]
+        cache_key = (goal_coin, frozenset(symbol_names[code] for code in topology.tolist()))
+        if cache_key not in path_cache:
+            metrics.inc('rates_path_searches_total', goal_coin=goal_coin)
+            df_first = df_pairs.iloc[first_rows]
+            coin_codes, coins = pd.factorize(pd.concat([df_first['base_coin'], df_first['quote_coin']], ignore_index=True))
+            coins = list(coins)
+            path_cache[cache_key] = search_tree(
+                coin_codes[:len(first_rows)], coin_codes[len(first_rows):], coins, df_first['symbol'].to_list(), coins.index(goal_coin)
+            ) if goal_coin in coins else {}
+        tree = path_cache[cache_key]
+
+        # price matrix of the group: dates x symbols of the topology
+        group_rows = np.concatenate([order[dt_bounds[dt_code]:dt_bounds[dt_code + 1]] for dt_code in dt_code_list])
+        date_pos = np.repeat(np.arange(len(dt_code_list)), [dt_bounds[dt_code + 1] - dt_bounds[dt_code] for dt_code in dt_code_list])
+        price_matrix = np.empty((len(dt_code_list), len(topology)))
+        price_matrix[date_pos, np.searchsorted(topology, symbol_codes[group_rows])] = prices[group_rows]
+        symbol_col = {symbol_names[code]: col for col, code in enumerate(topology.tolist())}
+
+        for coin in df_targets:
+            if coin == goal_coin:
+                conversion_path, usdt_amt = [], np.ones(len(dt_code_list))
+            elif coin in tree:
+                path = build_path(tree, coin)
+                conversion_path = [hop[:3] for hop in path]
+                usdt_amt = np.ones(len(dt_code_list))
+                with np.errstate(divide='ignore'):
+                    for _, _, symbol, exponent in path:
+                        usdt_amt *= price_matrix[:, symbol_col[symbol]] ** exponent
+            else:
+                conversion_path, usdt_amt = None, np.full(len(dt_code_list), np.nan)
+            results.append((coin, conversion_path, usdt_amt, dt_code_list))
+
+    metrics.inc('rates_topology_groups_total', len(topology_dates), goal_coin=goal_coin)
+    if not results:
+        metrics.record('rates_process', t0, rows=0, goal_coin=goal_coin)
+        return pd.DataFrame(columns=['coin', 'conversion_path', 'usdt_amt', 'oper_dt'])
+    target_pos = {coin: i for i, coin in enumerate(df_targets)}
+    dt_code_arr = np.concatenate([np.asarray(dt_code_list) for *_, dt_code_list in results])
+    df_rate = pd.DataFrame({
+        'coin': [coin for coin, _, _, dt_code_list in results for _ in dt_code_list],
+        'conversion_path': [conversion_path for _, conversion_path, _, dt_code_list in results for _ in dt_code_list],
+        'usdt_amt': np.concatenate([usdt_amt for _, _, usdt_amt, _ in results]),
+        'oper_dt': dts[dt_code_arr],
+    })
+    # same order as a date-by-date run: dates as they appear, targets as given
+    df_rate['_target_pos'] = df_rate['coin'].map(target_pos)
+    df_rate['_dt_code'] = dt_code_arr
+    df_rate = df_rate.sort_values(['_dt_code', '_target_pos'], kind='stable').drop(columns=['_dt_code', '_target_pos']).reset_index(drop=True)
+    metrics.record('rates_process', t0, rows=len(df_rate), goal_coin=goal_coin)
+    return df_rate
+
+
+class PathCache(OrderedDict):
+    """
+    path_cache of rates_process that keeps the maxsize most recently used search trees.
+    For caches shared across runs (daemon): every listing or delisting is a new topology, the old ones are not needed again
+    """
+    maxsize: int
+
+    def __init__(self, maxsize: int = 64) -> None:
+        super().__init__()
+        self.maxsize = maxsize
+
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+
+    def __setitem__(self, key, value) -> None:
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+class RateIndex:
+    """
+    Run-level conversion rates to goal_coin built once from all exchanges' pairs.
+    Every exchange gets rates from its own pairs (venue) and from the pairs of all exchanges (global),
+    the latter covers coins that have no route to goal_coin on their own venue.
+    """
+    goal_coin: str
+    prefer_venue: bool
+
+    def __init__(self, goal_coin: str = 'USDT', prefer_venue: bool = True, path_cache: dict | None = None) -> None:
+        self.goal_coin = goal_coin
+        self.prefer_venue = prefer_venue
+        # conversion paths by topology, may be shared between runs (daemon)
+        self.path_cache: dict = {} if path_cache is None else path_cache
+        self.venue_pairs: dict = {}
+        self.venue_targets: dict = {}
+        self.venue_rates: dict = {}
+        self.global_rates: pd.DataFrame = pd.DataFrame(columns=['coin', 'conversion_path', 'usdt_amt', 'oper_dt'])
+
+
+    def add_pairs(self, exchange_type: str, df_pairs: pd.DataFrame, targets: list) -> None:
+        # df_pairs: oper_dt, base_coin, quote_coin, symbol, price_avg
+        self.venue_pairs[exchange_type] = df_pairs[['oper_dt', 'base_coin', 'quote_coin', 'symbol', 'price_avg']]
+        self.venue_targets[exchange_type] = list(targets)
+
+
+    def build(self) -> None:
+        for exchange_type, df_pairs in self.venue_pairs.items():
+            self.venue_rates[exchange_type] = rates_process(df_pairs, self.venue_targets[exchange_type], self.goal_coin, self.path_cache)
+        if self.venue_pairs:
+            # one edge per (date, base, quote) across venues, priced by the median of venues' average prices
+            df_global = pd.concat(self.venue_pairs.values(), ignore_index=True)\
+                .groupby(['oper_dt', 'base_coin', 'quote_coin'], as_index=False, sort=False, observed=True)\
+                .agg(symbol=('symbol', 'first'), price_avg=('price_avg', 'median'))
+            global_targets = list(dict.fromkeys(coin for targets in self.venue_targets.values() for coin in targets))
+            self.global_rates = rates_process(df_global, global_targets, self.goal_coin, self.path_cache)
+
+
+    def query(self, exchange_type: str) -> pd.DataFrame:
+        """
+        Rates for the exchange's targets on the exchange's dates.
+        Returns a DataFrame with: coin, oper_dt, usdt_amt, conversion_path, rate_source ('venue' | 'global' | None)
+        """
+        df_venue = self.venue_rates.get(exchange_type)
+        if df_venue is None:
+            return pd.DataFrame(columns=['coin', 'oper_dt', 'usdt_amt', 'conversion_path', 'rate_source'])
+        df_rate = df_venue.merge(self.global_rates, 'left', on=['coin', 'oper_dt'], suffixes=('_venue', '_global'))
+        venue_found, global_found = df_rate['usdt_amt_venue'].notnull(), df_rate['usdt_amt_global'].notnull()
+        use_venue = venue_found & (self.prefer_venue | ~global_found)
+        df_rate['usdt_amt'] = df_rate['usdt_amt_venue'].where(use_venue, df_rate['usdt_amt_global'])
+        df_rate['conversion_path'] = df_rate['conversion_path_venue'].where(use_venue, df_rate['conversion_path_global'])
+        df_rate['rate_source'] = np.where(use_venue, 'venue', np.where(global_found, 'global', None))
+        return df_rate[['coin', 'oper_dt', 'usdt_amt', 'conversion_path', 'rate_source']]
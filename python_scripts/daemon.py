@@ -0,0 +1,246 @@
+"""
+Long-running ETL scheduler: keeps db engines (with reflected metadata and watermarks), HTTP sessions,
+exchange instances (instrument lists) and synced registries in memory and runs incremental loads
+right after the daily candles close and every INTERVAL minutes in between.
+
+    python daemon.py --interval 30 --close_delay 5 --port 8081
+
+Status endpoint (127.0.0.1:PORT by default):
+    /health  - 200 if the last cycle succeeded and is not older than two intervals, else 503
+    /status  - JSON with cycles, next runs, watermarks and instrument counts per exchange
+    /metrics - telemetry of the last cycle in Prometheus text format
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import datetime
+import json
+import os
+import signal
+import threading
+import time
+
+from exchange import Exchange
+from raw_etl import RawETLoader, DmETLoader
+from ccyconv import PathCache
+from metrics import metrics
+from superset_cache import refresh_dashboard_cache
+import main
+
+
+class EtlDaemon:
+    interval: datetime.timedelta
+    close_delay: datetime.timedelta
+    info_ttl: datetime.timedelta
+
+    def __init__(self,
+                 exchange_input_list: list | None = None,
+                 interval: int = 60,
+                 close_delay: int = 5,
+                 info_ttl: int = 24,
+                 rate_pref: str = 'venue',
+                 batch_size: int = 50,
+                 metrics_dir: str = 'telemetry',
+                 superset_url: str | None = None,
+                 transform_workers: int = 1,
+                 raw_format: str = 'json',
+        ) -> None:
+        """
+        interval and close_delay in minutes, info_ttl (instrument list refresh) in hours
+        """
+        self.exchange_keys = [key for key in main.exchange_dict if not exchange_input_list or key in exchange_input_list]
+        self.interval = datetime.timedelta(minutes=interval)
+        self.close_delay = datetime.timedelta(minutes=close_delay)
+        self.info_ttl = datetime.timedelta(hours=info_ttl)
+        self.rate_pref = rate_pref
+        self.batch_size = batch_size
+        self.metrics_dir = metrics_dir
+        self.superset_url = superset_url
+
+        self.raw_etl, self.dm_etl = RawETLoader(transform_workers, raw_format), DmETLoader()
+        self.exchange_dict: dict = {}
+        self.registry_dict: dict = {}
+        self.info_loaded_at: dict = {}
+        # bounded: a long-running process sees a new topology with every listing change
+        self.path_cache: PathCache = PathCache(maxsize=64)
+        self.next_run: dict = {key: self.now() for key in self.exchange_keys}
+        self.started_at = self.now()
+        self.cycles = 0
+        self.last_cycle: dict = {}
+        self.last_success: datetime.datetime | None = None
+        self.prometheus_text = ''
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+
+    @staticmethod
+    def now() -> datetime.datetime:
+        return datetime.datetime.now(tz=datetime.timezone.utc)
+
+
+    def next_candle_close(self, after: datetime.datetime) -> datetime.datetime:
+        # daily candles of all five venues are UTC days
+        return datetime.datetime.combine(after.date() + datetime.timedelta(days=1), datetime.time.min, tzinfo=datetime.timezone.utc)
+
+
+    def get_exchange(self, key: str) -> Exchange | None:
+        """
+        Warm exchange instance; instrument list and registry are refreshed once info_ttl passed
+        """
+        exchange = self.exchange_dict.get(key)
+        if exchange is not None and self.now() - self.info_loaded_at[key] < self.info_ttl:
+            return exchange
+        exchange = main.exchange_dict[key]()
+        if not exchange.spot_coins:
+            print(f'Warning: {key} instrument list is empty, keeping the previous one')
+            return self.exchange_dict.get(key)
+        self.registry_dict[exchange.name] = main.sync_info(exchange, self.now() - datetime.timedelta(days=1), self.raw_etl, self.dm_etl)
+        self.exchange_dict[key], self.info_loaded_at[key] = exchange, self.now()
+        return exchange
+
+
+    def run_cycle(self, keys: list) -> None:
+        t0, started_at = time.perf_counter(), self.now()
+        metrics.reset()
+        exchange_list, errors = [], []
+        for key in keys:
+            try:
+                exchange = self.get_exchange(key)
+            except Exception as msg:
+                print(f'Exception: {msg} occured while initializing {key}...')
+                exchange = None
+            if exchange is None:
+                errors.append(key)
+            else:
+                exchange_list.append(exchange)
+
+        pd_kline_dict = main.run_loads(
+            exchange_list, self.raw_etl, self.dm_etl, 'incremental',
+            rate_pref=self.rate_pref, batch_size=self.batch_size,
+            registry_dict=self.registry_dict, path_cache=self.path_cache
+        )
+        errors += sorted({'{exchange} {step}'.format(**dict(labels)) for (name, labels) in metrics.counters if name == 'load_errors_total'})
+        if self.superset_url and not errors:
+            refresh_dashboard_cache(self.superset_url, os.environ.get('SUPERSET_USER', 'superset'), os.environ.get('SUPERSET_PASSWORD', 'superset'))
+        metrics.set('daemon_cycle_seconds', time.perf_counter() - t0)
+        metrics.export(self.metrics_dir, mode='daemon', exchanges=keys)
+
+        finished_at = self.now()
+        with self._lock:
+            self.cycles += 1
+            self.last_cycle = {
+                'started_at': started_at.isoformat(timespec='seconds'),
+                'finished_at': finished_at.isoformat(timespec='seconds'),
+                'duration_s': round(time.perf_counter() - t0, 3),
+                'exchanges': keys,
+                'rows': {name: len(pd_kline) for name, pd_kline in pd_kline_dict.items()},
+                'errors': errors,
+            }
+            if not errors:
+                self.last_success = finished_at
+            self.prometheus_text = metrics.to_prometheus()
+            for key in keys:
+                self.next_run[key] = min(finished_at + self.interval, self.next_candle_close(finished_at) + self.close_delay)
+        print(f'Info: cycle {self.cycles} done in {self.last_cycle["duration_s"]}s, next run {min(self.next_run.values()).isoformat(timespec="seconds")}')
+
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'cycles': self.cycles,
+                'last_cycle': self.last_cycle,
+                'last_success': self.last_success.isoformat(timespec='seconds') if self.last_success else None,
+                'exchanges': {
+                    key: {
+                        'next_run': self.next_run[key].isoformat(timespec='seconds'),
+                        'instruments': len(self.exchange_dict[key].spot_coins) if key in self.exchange_dict else None,
+                        'info_loaded_at': self.info_loaded_at[key].isoformat(timespec='seconds') if key in self.info_loaded_at else None,
+                        'watermark': {k: str(v) for k, v in self.dm_etl.get_abs_values(main.exchange_dict[key].name).items()},
+                    }
+                    for key in self.exchange_keys
+                },
+            }
+
+
+    def healthy(self) -> bool:
+        with self._lock:
+            return self.last_success is not None and self.now() - self.last_success < 2 * self.interval + self.close_delay
+
+
+    def serve_status(self, host: str = '127.0.0.1', port: int = 8081) -> ThreadingHTTPServer:
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path == '/health':
+                    status, body, content_type = (200, b'ok', 'text/plain') if daemon.healthy() else (503, b'stale', 'text/plain')
+                elif self.path == '/status':
+                    status, body, content_type = 200, json.dumps(daemon.status(), indent=2, default=str).encode(), 'application/json'
+                elif self.path == '/metrics':
+                    with daemon._lock:
+                        status, body, content_type = 200, daemon.prometheus_text.encode(), 'text/plain; version=0.0.4'
+                else:
+                    status, body, content_type = 404, b'not found', 'text/plain'
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        httpd = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=httpd.serve_forever, name='daemon-status', daemon=True).start()
+        print(f'Info: status endpoint on http://{host}:{port}')
+        return httpd
+
+
+    def stop(self, *args) -> None:
+        print('Info: stopping after the current cycle')
+        self._stop.set()
+
+
+    def run_forever(self) -> None:
+        while not self._stop.is_set():
+            now = self.now()
+            due_keys = [key for key in self.exchange_keys if self.next_run[key] <= now]
+            if due_keys:
+                try:
+                    self.run_cycle(due_keys)
+                except Exception as msg:
+                    print(f'Exception: {msg} occured in cycle of {", ".join(due_keys)}...')
+                    with self._lock:
+                        for key in due_keys:
+                            self.next_run[key] = self.now() + self.interval
+                continue
+            self._stop.wait(min(60.0, (min(self.next_run.values()) - now).total_seconds()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-e', '--exchange', nargs='*', default=None, choices=list(main.exchange_dict), type=str)
+    parser.add_argument('-i', '--interval', nargs='?', default=60, type=int, help='minutes between incremental loads')
+    parser.add_argument('--close_delay', nargs='?', default=5, type=int, help='minutes after the daily candle close')
+    parser.add_argument('--info_ttl', nargs='?', default=24, type=int, help='hours between instrument list refreshes')
+    parser.add_argument('-r', '--rate_pref', nargs='?', default='venue', choices=['venue', 'global'])
+    parser.add_argument('-b', '--batch_size', nargs='?', default=50, type=int)
+    parser.add_argument('--metrics_dir', nargs='?', default='telemetry', type=str)
+    parser.add_argument('--host', nargs='?', default='127.0.0.1', type=str)
+    parser.add_argument('-p', '--port', nargs='?', default=8081, type=int)
+    parser.add_argument('--superset_url', nargs='?', default=os.environ.get('SUPERSET_URL'), type=str, help='refresh the dashboard cache after successful cycles')
+    parser.add_argument('-w', '--transform_workers', nargs='?', default=1, type=int, help='processes transforming raw klines, 1 transforms in-process')
+    parser.add_argument('--raw_format', nargs='?', default='json', choices=['json', 'packed'], help='packed also stores the candles of raw klines as packed arrays, read without JSON parsing')
+    namespace = parser.parse_args()
+
+    etl_daemon = EtlDaemon(namespace.exchange, namespace.interval, namespace.close_delay, namespace.info_ttl,
+                           namespace.rate_pref, namespace.batch_size, namespace.metrics_dir, namespace.superset_url, namespace.transform_workers,
+                           namespace.raw_format)
+    signal.signal(signal.SIGTERM, etl_daemon.stop)
+    signal.signal(signal.SIGINT, etl_daemon.stop)
+    httpd = etl_daemon.serve_status(namespace.host, namespace.port)
+    try:
+        etl_daemon.run_forever()
+    finally:
+        httpd.shutdown()
+        etl_daemon.raw_etl.close()
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Literal
+from typing import Literal, Iterator
 from json import JSONDecodeError
 import requests
 from requests.adapters import HTTPAdapter
@@ -7,32 +7,69 @@ from requests.packages.urllib3.util.retry import Retry
 from urllib3.exceptions import InsecureRequestWarning
 import datetime
 import calendar
+import json
+import os
+import threading
+import time
+from metrics import metrics
+
+
+_local = threading.local()
+# supported kline timeframes -> candle length in seconds ('D' is the daily timeframe stored so far)
+TIME_FRAMES: dict = {'D': 86400, '4h': 14400, '1h': 3600, '5m': 300, '1m': 60}
+
+
+def get_session() -> requests.Session:
+    """
+    Session with retries, one per thread: keeps connection pools (and TLS sessions) warm between requests
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        retries = Retry(total=10,
+                        backoff_factor=1,
+                        #status_forcelist=[500, 502, 503, 504],
+                        #allowed_methods=frozenset(['GET'])
+        )
+        session.mount('http://', HTTPAdapter(max_retries=retries))
+        session.mount('https://', HTTPAdapter(max_retries=retries))
+        _local.session = session
+    return session
 
 
-def get_request(url: str, params: dict | None = None):
-    session = requests.Session()
+def get_request(url: str, params: dict | None = None, exchange: str = '', endpoint: str = ''):
+    session = get_session()
     requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
 
-    retries = Retry(total=10,
-                    backoff_factor=1,
-                    #status_forcelist=[500, 502, 503, 504],
-                    #allowed_methods=frozenset(['GET'])
-    )
-
-    session.mount('http://', HTTPAdapter(max_retries=retries))
-    session.mount('https://', HTTPAdapter(max_retries=retries))
-
-    if params:
-        response = session.get(
-            url=url,
-            params=params,
-            verify=False
-        )
-    else: 
-        response = session.get(
-            url=url,
-            verify=False
-        )
+    t0 = time.perf_counter()
+    try:
+        if params:
+            response = session.get(
+                url=url,
+                params=params,
+                verify=False
+            )
+        else: 
+            response = session.get(
+                url=url,
+                verify=False
+            )
+    except Exception:
+        metrics.inc('http_request_errors_total', exchange=exchange, endpoint=endpoint)
+        raise
+    metrics.observe('http_request_duration_seconds', time.perf_counter() - t0, exchange=exchange, endpoint=endpoint)
+    if endpoint.startswith('kline'):
+        # time from the start of the run to the first kline response, per exchange and overall
+        elapsed = time.time() - metrics.started_at
+        metrics.set_once('time_to_first_request_seconds', elapsed, exchange=exchange)
+        metrics.set_once('time_to_first_request_seconds', elapsed, exchange='ALL')
+    metrics.inc('http_requests_total', exchange=exchange, endpoint=endpoint, status=response.status_code)
+    metrics.inc('http_response_bytes_total', len(response.content), exchange=exchange, endpoint=endpoint)
+    retry_history = getattr(getattr(response.raw, 'retries', None), 'history', ())
+    if retry_history:
+        metrics.inc('http_retries_total', len(retry_history), exchange=exchange, endpoint=endpoint)
+    if response.status_code in (418, 429):
+        metrics.inc('http_throttled_total', exchange=exchange, endpoint=endpoint)
     return response
 
 
@@ -79,10 +116,118 @@ class Exchange(ABC):
         # get kline of spot pairs
         raise NotImplementedError
 
+    @property
+    @abstractmethod
+    def interval_dict(self) -> dict:
+        # TIME_FRAMES key -> exchange's kline interval
+        raise NotImplementedError
+
+    @property
+    @abstractmethod
+    def page_limit(self) -> int | None:
+        # max candles per kline request, None if the endpoint can't be paged by time range
+        raise NotImplementedError
+
+    # number of the latest candles available at all, None if unlimited
+    history_limit: int | None = None
+    # instrument list snapshots: constructors take the list from a snapshot younger than snapshot_ttl seconds (0 - always request)
+    snapshot_dir: str = os.environ.get('EXCHANGE_SNAPSHOT_DIR', 'snapshots')
+    snapshot_ttl: int = 0
+    # kline requests that failed (transport error, non-200, undecodable body) - their empty result is not an empty window
+    kline_errors: int = 0
+
     @abstractmethod
     def _kline(self) -> dict | list:
         # get kline of spot pairs
         raise NotImplementedError
+
+    def load_snapshot(self) -> bool:
+        """
+        Takes info_resp, info_ts and spot_coins from a snapshot younger than snapshot_ttl, False if there is none
+        """
+        if not self.snapshot_ttl:
+            return False
+        path = os.path.join(self.snapshot_dir, f'{self.name.lower()}_info.json')
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if age > self.snapshot_ttl:
+                return False
+            with open(path) as f:
+                snapshot = json.load(f)
+            self.info_resp, self.info_ts, self.spot_coins = snapshot['info_resp'], snapshot['info_ts'], snapshot['spot_coins']
+        except (OSError, ValueError, KeyError):
+            return False
+        metrics.inc('exchange_info_snapshot_hits_total', exchange=self.name)
+        print(f'Info: {self.name} instrument list taken from snapshot {path} ({age / 60:.0f} min old)')
+        return True
+
+
+    def save_snapshot(self) -> None:
+        # written only when snapshots are used, via a temporary file so a concurrent reader never sees a partial one
+        if not self.snapshot_ttl or not self.spot_coins:
+            return
+        path = os.path.join(self.snapshot_dir, f'{self.name.lower()}_info.json')
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            with open(f'{path}.{os.getpid()}.tmp', 'w') as f:
+                json.dump({'info_resp': self.info_resp, 'info_ts': self.info_ts, 'spot_coins': self.spot_coins}, f)
+            os.replace(f'{path}.{os.getpid()}.tmp', path)
+        except OSError as msg:
+            print(f'Warning: {self.name} instrument list snapshot is not saved: {msg}')
+
+
+    @staticmethod
+    def norm_symbol(symbol: str) -> str:
+        # exchange's native symbol -> symbol stored in raw/dm layers (registered in spot.dim_coin)
+        return symbol
+
+    @staticmethod
+    def floor_ts(dt: datetime.datetime, time_frame: str = 'D') -> int:
+        # epoch seconds of the candle open containing dt (start of the day for 'D')
+        return calendar.timegm(dt.timetuple()) // TIME_FRAMES[time_frame] * TIME_FRAMES[time_frame]
+
+    def load_kline_paged(self,
+                         coins: list,
+                         start_dt: datetime.datetime,
+                         end_dt: datetime.datetime | None = None,
+                         time_frame: str = '1h',
+        ) -> list:
+        """
+        Candles of coins from start_dt to end_dt (now) requested in windows of page_limit candles,
+        returns one (symbol, response) per window. Consecutive windows share one candle, duplicates are dropped by kline_transform
+        """
+        tf_sec = TIME_FRAMES[time_frame]
+        start_ts = self.floor_ts(start_dt, time_frame)
+        end_ts = self.floor_ts(end_dt or datetime.datetime.now(tz=datetime.timezone.utc), time_frame)
+        if self.page_limit is None:
+            if self.history_limit and (end_ts - start_ts) // tf_sec >= self.history_limit:
+                print(f'Warning: {self.name} serves the last {self.history_limit} {time_frame} candles only, earlier ones are not loaded')
+            window_list = [(start_ts, None)]
+        else:
+            step = (self.page_limit - 1) * tf_sec
+            window_list = [(ts, min(ts + step, end_ts)) for ts in range(start_ts, end_ts + 1, step)]
+        to_dt = lambda ts: datetime.datetime.fromtimestamp(ts, tz=datetime.timezone.utc) if ts is not None else None
+        return [
+            (
+                self.norm_symbol(coin[0]),
+                self._kline(symbol=coin[0], limit=self.page_limit, start_dt=to_dt(window_start), end_dt=to_dt(window_end), time_frame=time_frame)
+            )
+            for coin in coins
+            for window_start, window_end in window_list
+        ]
+
+    def iter_kline(self, batch_size: int = 50, coins: list | None = None, time_frame: str = 'D', **kwargs) -> Iterator[tuple]:
+        """
+        Yields (load_kline result, kline_ts) for spot_coins (or a subset of them) in batches of batch_size symbols,
+        kwargs are passed to load_kline; intraday timeframes are fetched by load_kline_paged from kwargs['start_dt']
+        """
+        coins = self.spot_coins if coins is None else coins
+        for i in range(0, len(coins), batch_size):
+            if time_frame == 'D':
+                kline_list = self.load_kline(coins=coins[i:i + batch_size], **kwargs)
+            else:
+                kline_list = self.load_kline_paged(coins[i:i + batch_size], kwargs['start_dt'], kwargs.get('end_dt'), time_frame)
+            yield kline_list, self.kline_ts
     
 
 class Bybit(Exchange):
@@ -93,6 +238,8 @@ class Bybit(Exchange):
         'kline': '/v5/market/kline'  # https://bybit-exchange.github.io/docs/v5/market/kline
     }
     category: str = 'spot'
+    interval_dict: dict = {'D': 'D', '4h': '240', '1h': '60', '5m': '5', '1m': '1'}
+    page_limit: int | None = 1000
     spot_coins: list = []
     info_resp: dict = {}
     info_ts: int = 0
@@ -104,15 +251,18 @@ class Bybit(Exchange):
         Initialization of a class instance by obtaining exchange's list of available spot pairs
         """
         url: str = self.url + self.endpoint_dict['info']
+        if self.load_snapshot():
+            return
         try:
             params={
                 'category': self.category
             }
-            resp = get_request(url=url, params=params)  #requests.get(url=url, params={'category': self.category})
+            resp = get_request(url=url, params=params, exchange=self.name, endpoint='info')  #requests.get(url=url, params={'category': self.category})
             if resp.ok:
                 self.info_resp = resp.json()
                 self.spot_coins = [[coin['symbol'], coin['baseCoin'], coin['quoteCoin'], coin['status']] for coin in resp.json()['result']['list']]
                 self.info_ts = self.info_resp.get('time', 0)
+                self.save_snapshot()
             else:
                 print('Bybit coins domain is unreacheable')
             print('Bybit initialized')
@@ -127,6 +277,7 @@ class Bybit(Exchange):
                limit: int | None = None,
                start_dt: datetime.datetime | None = None,
                end_dt: datetime.datetime | None = None,
+               time_frame: str = 'D',
     ) -> dict:
         """
         Incremental (last day): 
@@ -138,29 +289,31 @@ class Bybit(Exchange):
         url: str = self.url + self.endpoint_dict['kline']
         params: dict = {
             'category': self.category,
-            'interval': 'D',
+            'interval': self.interval_dict[time_frame],
             'symbol': symbol
         }
         if not any([limit, start_dt, end_dt]):
             tmp_start_dt = datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=1)
             tmp_end_dt = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(days=1)
-            params['start'] = calendar.timegm(tmp_start_dt.date().timetuple()) * 1000
-            params['end'] = calendar.timegm(tmp_end_dt.date().timetuple()) * 1000
+            params['start'] = self.floor_ts(tmp_start_dt, time_frame) * 1000
+            params['end'] = self.floor_ts(tmp_end_dt, time_frame) * 1000
         elif limit and not any([start_dt, end_dt]):
             params['limit'] = limit
         elif limit and start_dt and not end_dt:
-            params['start'] = calendar.timegm(start_dt.date().timetuple()) * 1000
+            params['start'] = self.floor_ts(start_dt, time_frame) * 1000
             params['limit'] = limit
         elif limit and not start_dt and end_dt:
-            params['end'] = calendar.timegm(end_dt.date().timetuple()) * 1000
+            params['end'] = self.floor_ts(end_dt, time_frame) * 1000
             params['limit'] = limit
 
         if start_dt:
-            params['start'] = calendar.timegm(start_dt.date().timetuple()) * 1000
+            params['start'] = self.floor_ts(start_dt, time_frame) * 1000
         if end_dt:
-            params['end'] = calendar.timegm(end_dt.date().timetuple()) * 1000
+            params['end'] = self.floor_ts(end_dt, time_frame) * 1000
+        if limit:
+            params['limit'] = limit
         try:
-            resp = get_request(url=url, params=params)  #requests.get(url=url, params=params) 
+            resp = get_request(url=url, params=params, exchange=self.name, endpoint='kline')  #requests.get(url=url, params=params) 
             if resp.ok:
                 if any([resp.json()['retCode'] != 0, 
                         resp.json()['retMsg'] not in ['OK', 'success', 'SUCCESS', ''], 
@@ -170,12 +323,15 @@ class Bybit(Exchange):
                 return resp.json()
             else:
                 print(f'Error: Bybit kline endpoint {resp.status_code = }')
+                self.kline_errors += 1
                 return {}
         except JSONDecodeError as json_err:
             print(f'Exception: JSONDecodeError {json_err = }, {params = }')
+            self.kline_errors += 1
             return {}
         except Exception as msg:
             print(f'Exception: Bybit get_kline {msg}, {params = }')
+            self.kline_errors += 1
             return {}
 
 
@@ -184,12 +340,14 @@ class Bybit(Exchange):
                    limit: int | None = None,
                    start_dt: datetime.datetime | None = None,
                    end_dt: datetime.datetime | None = None,
+                   coins: list | None = None,
         ) -> list:
         """
         Function manages the process of kline data collection:
             1. inc - incremental (last day)
             2. init - initial (last 1000 days)
             3. custom - requires start_dt || end_dt || limit to be provided
+        coins limits the collection to a subset of spot_coins
         """
         if mode == 'inc':
             return [
@@ -199,7 +357,7 @@ class Bybit(Exchange):
                                 start_dt=datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=1), 
                                 limit=1)
                 )
-                for coin in self.spot_coins
+                for coin in (self.spot_coins if coins is None else coins)
             ]
         elif mode == 'init':
             return [
@@ -208,7 +366,7 @@ class Bybit(Exchange):
                     self._kline(symbol=coin[0],
                                 limit=1000)
                 )
-                for coin in self.spot_coins
+                for coin in (self.spot_coins if coins is None else coins)
             ]
         elif mode == 'custom':
             return [
@@ -219,7 +377,7 @@ class Bybit(Exchange):
                                 start_dt=start_dt,
                                 end_dt=end_dt)
                 )
-                for coin in self.spot_coins
+                for coin in (self.spot_coins if coins is None else coins)
             ]
 
 
@@ -231,6 +389,8 @@ class Binance(Exchange):
         'info': '/api/v3/exchangeInfo'  # https://developers.binance.com/docs/binance-spot-api-docs/rest-api/general-endpoints
     }
     category: str = 'spot'
+    interval_dict: dict = {'D': '1d', '4h': '4h', '1h': '1h', '5m': '5m', '1m': '1m'}
+    page_limit: int | None = 1000
     spot_coins: list = []
     info_resp: dict = {}
     info_ts: int = 0
@@ -241,17 +401,20 @@ class Binance(Exchange):
         Initialization of a class instance by obtaining exchange's list of available spot pairs
         """
         url: str = self.url + self.endpoint_dict['info']
+        if self.load_snapshot():
+            return
         try:
             params = {
                 'permissions': self.category.upper(), 
                 'showPermissionSets': 'false',
                 'symbolStatus': 'TRADING'
             }
-            resp = get_request(url=url, params=params)  #requests.get(url=url, params=params)
+            resp = get_request(url=url, params=params, exchange=self.name, endpoint='info')  #requests.get(url=url, params=params)
             if resp.ok:
                 self.info_resp = resp.json()
                 self.spot_coins = [[coin['symbol'], coin['baseAsset'], coin['quoteAsset'], coin['status']] for coin in resp.json()['symbols']]
                 self.info_ts = self.info_resp.get('serverTime', 0)
+                self.save_snapshot()
             else:
                 print('Binance coins domain is unreacheable')
             print('Binance initialized')
@@ -266,6 +429,7 @@ class Binance(Exchange):
                limit: int | None = None,
                start_dt: datetime.datetime | None = None,
                end_dt: datetime.datetime | None = None,
+               time_frame: str = 'D',
     ) -> list:
         """
         Incremental (last day): 
@@ -276,40 +440,45 @@ class Binance(Exchange):
         """
         url: str = self.url + self.endpoint_dict['kline']
         params: dict = {
-            'interval': '1d',
+            'interval': self.interval_dict[time_frame],
             'symbol': symbol
         }
         if not any([limit, start_dt, end_dt]):
             tmp_start_dt = datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=1)
             tmp_end_dt = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(days=1)
-            params['startTime'] = calendar.timegm(tmp_start_dt.date().timetuple()) * 1000
-            params['endTime'] = calendar.timegm(tmp_end_dt.date().timetuple()) * 1000
+            params['startTime'] = self.floor_ts(tmp_start_dt, time_frame) * 1000
+            params['endTime'] = self.floor_ts(tmp_end_dt, time_frame) * 1000
         elif limit and not any([start_dt, end_dt]):
             params['limit'] = limit
         elif limit and start_dt and not end_dt:
-            params['startTime'] = calendar.timegm(start_dt.date().timetuple()) * 1000
+            params['startTime'] = self.floor_ts(start_dt, time_frame) * 1000
             params['limit'] = limit
         elif limit and not start_dt and end_dt:
-            params['endTime'] = calendar.timegm(end_dt.date().timetuple()) * 1000
+            params['endTime'] = self.floor_ts(end_dt, time_frame) * 1000
             params['limit'] = limit
 
         if start_dt:
-            params['startTime'] = calendar.timegm(start_dt.date().timetuple()) * 1000
+            params['startTime'] = self.floor_ts(start_dt, time_frame) * 1000
         if end_dt:
-            params['endTime'] = calendar.timegm(end_dt.date().timetuple()) * 1000
+            params['endTime'] = self.floor_ts(end_dt, time_frame) * 1000
+        if limit:
+            params['limit'] = limit
         try:
-            resp = get_request(url=url, params=params)  #requests.get(url=url, params=params) 
+            resp = get_request(url=url, params=params, exchange=self.name, endpoint='kline')  #requests.get(url=url, params=params) 
             if resp.ok:
                 self.kline_ts = calendar.timegm(datetime.datetime.strptime(resp.headers.get('Date', 'Thu, 01 Jan 1970 00:00:00 GMT'), '%a, %d %b %Y %H:%M:%S %Z').timetuple()) * 1000
                 return resp.json()
             else:
                 print(f'Error: Binance kline endpoint {resp.status_code = }')
+                self.kline_errors += 1
                 return []
         except JSONDecodeError as json_err:
             print(f'Exception: JSONDecodeError {json_err = }, {params = }')
+            self.kline_errors += 1
             return []
         except Exception as msg:
             print(f'Exception: Binance get_kline {msg}, {params = }')
+            self.kline_errors += 1
             return []
         
 
@@ -318,12 +487,14 @@ class Binance(Exchange):
                    limit: int | None = None,
                    start_dt: datetime.datetime | None = None,
                    end_dt: datetime.datetime | None = None,
+                   coins: list | None = None,
         ) -> list:
         """
         Function manages the process of kline data collection:
             1. inc - incremental (last day)
             2. init - initial (last 1000 days)
             3. custom - requires start_dt || end_dt || limit to be provided
+        coins limits the collection to a subset of spot_coins
         """
         if mode == 'inc':
             return [
@@ -333,7 +504,7 @@ class Binance(Exchange):
                                 start_dt=datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=1), 
                                 limit=1)
                 )
-                for coin in self.spot_coins
+                for coin in (self.spot_coins if coins is None else coins)
             ]
         elif mode == 'init':
             return [
@@ -342,7 +513,7 @@ class Binance(Exchange):
                     self._kline(symbol=coin[0],
                                 limit=1000)
                 )
-                for coin in self.spot_coins
+                for coin in (self.spot_coins if coins is None else coins)
             ]
         elif mode == 'custom':
             return [
@@ -353,7 +524,7 @@ class Binance(Exchange):
                             start_dt=start_dt,
                             end_dt=end_dt)
                 )
-                for coin in self.spot_coins
+                for coin in (self.spot_coins if coins is None else coins)
             ]
 
 
@@ -365,6 +536,9 @@ class Gateio(Exchange):
         'info': '/spot/currency_pairs'
     }
     category: str = 'spot'
+    interval_dict: dict = {'D': '1d', '4h': '4h', '1h': '1h', '5m': '5m', '1m': '1m'}
+    # limit can't be combined with from/to, a window of 1000 candles is the maximum
+    page_limit: int | None = 1000
     spot_coins: list = []
     info_resp: dict = {}
     info_ts: int = 0
@@ -375,12 +549,15 @@ class Gateio(Exchange):
         Initialization of a class instance by obtaining exchange's list of available spot pairs
         """
         url: str = self.url + self.endpoint_dict['info']
+        if self.load_snapshot():
+            return
         try:
-            resp = get_request(url=url)  #requests.get(url=url)
+            resp = get_request(url=url, exchange=self.name, endpoint='info')  #requests.get(url=url)
             if resp.ok:
                 self.info_resp = resp.json()
                 self.spot_coins = [[coin['id'], coin['base'], coin['quote'], coin['trade_status']] for coin in resp.json()]
                 self.info_ts = int(int(resp.headers.get('X-Out-Time', 0)) / 1000)
+                self.save_snapshot()
             else:
                 print('Gateio coins domain is unreacheable')
             print('Gateio initialized')
@@ -390,11 +567,17 @@ class Gateio(Exchange):
             print(f'Exception: Gateio init {msg}')
 
 
+    @staticmethod
+    def norm_symbol(symbol: str) -> str:
+        return symbol.replace('_', '')
+
+
     def _kline(self, 
                symbol: str,
                limit: int | None = None,
                start_dt: datetime.datetime | None = None,
                end_dt: datetime.datetime | None = None,
+               time_frame: str = 'D',
     ) -> list:
         """
         Incremental (last day): 
@@ -405,40 +588,43 @@ class Gateio(Exchange):
         """
         url: str = self.url + self.endpoint_dict['kline']
         params: dict = {
-            'interval': '1d',
+            'interval': self.interval_dict[time_frame],
             'currency_pair': symbol
         }
         if not any([limit, start_dt, end_dt]):
             tmp_start_dt = datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=1)
             tmp_end_dt = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(days=1)
-            params['from'] = calendar.timegm(tmp_start_dt.date().timetuple()) 
-            params['to'] = calendar.timegm(tmp_end_dt.date().timetuple()) 
+            params['from'] = self.floor_ts(tmp_start_dt, time_frame) 
+            params['to'] = self.floor_ts(tmp_end_dt, time_frame) 
         elif limit and not any([start_dt, end_dt]):
             params['limit'] = limit
         elif limit and start_dt and not end_dt:
-            params['from'] = calendar.timegm(start_dt.date().timetuple()) 
+            params['from'] = self.floor_ts(start_dt, time_frame) 
             params['limit'] = limit
         elif limit and not start_dt and end_dt:
-            params['to'] = calendar.timegm(end_dt.date().timetuple()) 
+            params['to'] = self.floor_ts(end_dt, time_frame) 
             params['limit'] = limit
 
         if start_dt:
-            params['from'] = calendar.timegm(start_dt.date().timetuple()) 
+            params['from'] = self.floor_ts(start_dt, time_frame) 
         if end_dt:
-            params['to'] = calendar.timegm(end_dt.date().timetuple()) 
+            params['to'] = self.floor_ts(end_dt, time_frame) 
         try:
-            resp = get_request(url=url, params=params)  #requests.get(url=url, params=params) 
+            resp = get_request(url=url, params=params, exchange=self.name, endpoint='kline')  #requests.get(url=url, params=params) 
             if resp.ok:
                 self.kline_ts = int(int(resp.headers.get('X-Out-Time', 0)) / 1000)
                 return resp.json()
             else:
                 print(f'Error: Gateio kline endpoint {resp.status_code = }')
+                self.kline_errors += 1
                 return []
         except JSONDecodeError as json_err:
             print(f'Exception: Gateio JSONDecodeError {json_err = }, {params = }')
+            self.kline_errors += 1
             return []
         except Exception as msg:
             print(f'Exception: Gateio get_kline {msg}, {params = }')
+            self.kline_errors += 1
             return []
         
 
@@ -447,42 +633,44 @@ class Gateio(Exchange):
                    limit: int | None = None,
                    start_dt: datetime.datetime | None = None,
                    end_dt: datetime.datetime | None = None,
+                   coins: list | None = None,
         ) -> list:
         """
         Function manages the process of kline data collection:
             1. inc - incremental (last day)
             2. init - initial (last 1000 days)
             3. custom - requires start_dt || end_dt || limit to be provided
+        coins limits the collection to a subset of spot_coins
         """
         if mode == 'inc':
             return [
                 (
-                    coin[0].replace('_', ''),
+                    self.norm_symbol(coin[0]),
                     self._kline(symbol=coin[0],
                                 start_dt=datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=1), 
                                 limit=1)
                 )
-                for coin in self.spot_coins
+                for coin in (self.spot_coins if coins is None else coins)
             ]
         elif mode == 'init':
             return [
                 (
-                    coin[0].replace('_', ''),
+                    self.norm_symbol(coin[0]),
                     self._kline(symbol=coin[0],
                                 limit=1000)
                 )
-                for coin in self.spot_coins
+                for coin in (self.spot_coins if coins is None else coins)
             ]
         elif mode == 'custom':
             return [
                 (
-                    coin[0].replace('_', ''),
+                    self.norm_symbol(coin[0]),
                     self._kline(symbol=coin[0],
                             limit=limit,
                             start_dt=start_dt,
                             end_dt=end_dt)
                 )
-                for coin in self.spot_coins
+                for coin in (self.spot_coins if coins is None else coins)
             ]
 
 
@@ -494,6 +682,10 @@ class Kraken(Exchange):
         'info': '/AssetPairs'
     }
     category: str = 'spot'
+    interval_dict: dict = {'D': '1440', '4h': '240', '1h': '60', '5m': '5', '1m': '1'}
+    # OHLC returns at most the last 720 candles of any interval and can't be paged back
+    page_limit: int | None = None
+    history_limit: int | None = 720
     spot_coins: list = []
     info_resp: dict = {}
     info_ts: int = 0
@@ -504,12 +696,15 @@ class Kraken(Exchange):
         Initialization of a class instance by obtaining exchange's list of available spot pairs
         """
         url: str = self.url + self.endpoint_dict['info']
+        if self.load_snapshot():
+            return
         try:
-            resp = get_request(url=url)  #requests.get(url=url)
+            resp = get_request(url=url, exchange=self.name, endpoint='info')  #requests.get(url=url)
             if resp.ok:
                 self.info_resp = resp.json()
                 self.spot_coins = [[coin_k, coin_val['base'], coin_val['quote'], coin_val['status']] for coin_k, coin_val in resp.json()['result'].items()]
                 self.info_ts = calendar.timegm(datetime.datetime.strptime(resp.headers.get('Date', 'Thu, 01 Jan 1970 00:00:00 GMT'), '%a, %d %b %Y %H:%M:%S %Z').timetuple()) * 1000
+                self.save_snapshot()
             else:
                 print('Kraken coins domain is unreacheable')
             print('Kraken initialized')
@@ -524,6 +719,7 @@ class Kraken(Exchange):
                limit: int | None = None,
                start_dt: datetime.datetime | None = None,
                end_dt: datetime.datetime | None = None,
+               time_frame: str = 'D',
     ) -> list:
         """
         Incremental (last day): 
@@ -534,25 +730,28 @@ class Kraken(Exchange):
         """
         url: str = self.url + self.endpoint_dict['kline']
         params: dict = {
-            'interval': '1440',
+            'interval': self.interval_dict[time_frame],
             'pair': symbol
         }
 
         if start_dt:
-            params['since'] = calendar.timegm(start_dt.date().timetuple()) 
+            params['since'] = self.floor_ts(start_dt, time_frame) 
         try:
-            resp = get_request(url=url, params=params)  #requests.get(url=url, params=params) 
+            resp = get_request(url=url, params=params, exchange=self.name, endpoint='kline')  #requests.get(url=url, params=params) 
             if resp.ok:
                 self.kline_ts = calendar.timegm(datetime.datetime.strptime(resp.headers.get('Date', 'Thu, 01 Jan 1970 00:00:00 GMT'), '%a, %d %b %Y %H:%M:%S %Z').timetuple()) * 1000
                 return resp.json()
             else:
                 print(f'Error: Kraken kline endpoint {resp.status_code = }')
+                self.kline_errors += 1
                 return []
         except JSONDecodeError as json_err:
             print(f'Exception: JSONDecodeError {json_err = }, {params = }')
+            self.kline_errors += 1
             return []
         except Exception as msg:
             print(f'Exception: Kraken get_kline {msg}, {params = }')
+            self.kline_errors += 1
             return []
         
 
@@ -561,12 +760,14 @@ class Kraken(Exchange):
                    limit: int | None = None,
                    start_dt: datetime.datetime | None = None,
                    end_dt: datetime.datetime | None = None,
+                   coins: list | None = None,
         ) -> list:
         """
         Function manages the process of kline data collection:
             1. inc - incremental (last day)
             2. init - initial (last 1000 days)
             3. custom - requires start_dt || end_dt || limit to be provided
+        coins limits the collection to a subset of spot_coins
         """
         if mode == 'inc':
             return [
@@ -575,7 +776,7 @@ class Kraken(Exchange):
                     self._kline(symbol=coin[0],
                                 start_dt=datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=1))
                 )
-                for coin in self.spot_coins
+                for coin in (self.spot_coins if coins is None else coins)
             ]
         elif mode == 'init':
             return [
@@ -583,7 +784,7 @@ class Kraken(Exchange):
                     coin[0],
                     self._kline(symbol=coin[0])
                 )
-                for coin in self.spot_coins
+                for coin in (self.spot_coins if coins is None else coins)
             ]
         elif mode == 'custom':
             return [
@@ -592,7 +793,7 @@ class Kraken(Exchange):
                     self._kline(symbol=coin[0],
                                 start_dt=start_dt)
                 )
-                for coin in self.spot_coins
+                for coin in (self.spot_coins if coins is None else coins)
             ]
 
 
@@ -601,9 +802,13 @@ class Okx(Exchange):
     url: str = 'https://www.okx.com/api/v5/'
     endpoint_dict: dict = {
         'kline': '/market/candles',  # https://www.okx.com/docs-v5/en/#public-data
+        'kline_history': '/market/history-candles',
         'info': '/public/instruments'
     }
     category: str = 'spot'
+    interval_dict: dict = {'D': '1Dutc', '4h': '4H', '1h': '1H', '5m': '5m', '1m': '1m'}
+    # history-candles returns at most 100 candles per request
+    page_limit: int | None = 100
     spot_coins: list = []
     info_resp: dict = {}
     info_ts: int = 0
@@ -614,15 +819,18 @@ class Okx(Exchange):
         Initialization of a class instance by obtaining exchange's list of available spot pairs
         """
         url: str = self.url + self.endpoint_dict['info']
+        if self.load_snapshot():
+            return
         try:
             params = {
                 'instType': 'SPOT'
             }
-            resp = get_request(url=url, params=params)  #requests.get(url=url, params=params)
+            resp = get_request(url=url, params=params, exchange=self.name, endpoint='info')  #requests.get(url=url, params=params)
             if resp.ok:
                 self.info_resp = resp.json()
                 self.spot_coins = [[coin['instId'], coin['baseCcy'], coin['quoteCcy'], coin['state']] for coin in resp.json()['data']]
                 self.info_ts = calendar.timegm(datetime.datetime.strptime(resp.headers.get('Date', 'Thu, 01 Jan 1970 00:00:00 GMT'), '%a, %d %b %Y %H:%M:%S %Z').timetuple()) * 1000
+                self.save_snapshot()
             else:
                 print('Okx coins domain is unreacheable')
             print('Okx initialized')
@@ -632,11 +840,17 @@ class Okx(Exchange):
             print(f'Exception: Okx init {msg}')
 
 
+    @staticmethod
+    def norm_symbol(symbol: str) -> str:
+        return symbol.replace('-', '')
+
+
     def _kline(self, 
                symbol: str,
                limit: int | None = None,
                start_dt: datetime.datetime | None = None,
                end_dt: datetime.datetime | None = None,
+               time_frame: str = 'D',
     ) -> list:
         """
         Incremental (last day): 
@@ -645,42 +859,54 @@ class Okx(Exchange):
             start_dt=datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=1), 
             limit=1)
         """
-        url: str = self.url + self.endpoint_dict['kline']
+        # recent candles only are served by /market/candles for intraday bars
+        url: str = self.url + self.endpoint_dict['kline' if time_frame == 'D' else 'kline_history']
         params: dict = {
-            'bar': '1Dutc',
+            'bar': self.interval_dict[time_frame],
             'instId': symbol
         }
         if not any([limit, start_dt, end_dt]):
             tmp_start_dt = datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=1)
             tmp_end_dt = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(days=1)
-            params['before'] = calendar.timegm(tmp_start_dt.date().timetuple()) * 1000
-            params['after'] = calendar.timegm(tmp_end_dt.date().timetuple()) * 1000
+            params['before'] = self.floor_ts(tmp_start_dt, time_frame) * 1000
+            params['after'] = self.floor_ts(tmp_end_dt, time_frame) * 1000
         elif limit and not any([start_dt, end_dt]):
             params['limit'] = limit
         elif limit and start_dt and not end_dt:
-            params['before'] = calendar.timegm(start_dt.date().timetuple()) * 1000
+            params['before'] = self.floor_ts(start_dt, time_frame) * 1000
             params['limit'] = limit
         elif limit and not start_dt and end_dt:
-            params['after'] = calendar.timegm(end_dt.date().timetuple()) * 1000
+            params['after'] = self.floor_ts(end_dt, time_frame) * 1000
             params['limit'] = limit
 
         if start_dt:
-            params['before'] = calendar.timegm(start_dt.date().timetuple()) * 1000
+            params['before'] = self.floor_ts(start_dt, time_frame) * 1000
         if end_dt:
-            params['after'] = calendar.timegm(end_dt.date().timetuple()) * 1000
+            params['after'] = self.floor_ts(end_dt, time_frame) * 1000
+        if limit:
+            params['limit'] = limit
+        if time_frame != 'D':
+            # before / after are exclusive, paged windows include both bounds
+            if 'before' in params:
+                params['before'] -= 1
+            if 'after' in params:
+                params['after'] += 1
         try:
-            resp = get_request(url=url, params=params)  #requests.get(url=url, params=params) 
+            resp = get_request(url=url, params=params, exchange=self.name, endpoint='kline')  #requests.get(url=url, params=params) 
             if resp.ok:
                 self.kline_ts = calendar.timegm(datetime.datetime.strptime(resp.headers.get('Date', 'Thu, 01 Jan 1970 00:00:00 GMT'), '%a, %d %b %Y %H:%M:%S %Z').timetuple()) * 1000
                 return resp.json()
             else:
                 print(f'Error: Okx kline endpoint {resp.status_code = }')
+                self.kline_errors += 1
                 return []
         except JSONDecodeError as json_err:
             print(f'Exception: Okx JSONDecodeError {json_err = }, {params = }')
+            self.kline_errors += 1
             return []
         except Exception as msg:
             print(f'Exception: Okx get_kline {msg}, {params = }')
+            self.kline_errors += 1
             return []
         
 
@@ -689,40 +915,42 @@ class Okx(Exchange):
                    limit: int | None = None,
                    start_dt: datetime.datetime | None = None,
                    end_dt: datetime.datetime | None = None,
+                   coins: list | None = None,
         ) -> list:
         """
         Function manages the process of kline data collection:
             1. inc - incremental (last day)
             2. init - initial (last 300 days)
             3. custom - requires start_dt || end_dt || limit to be provided
+        coins limits the collection to a subset of spot_coins
         """
         if mode == 'inc':
             return [
                 (
-                    coin[0].replace('-', ''),
+                    self.norm_symbol(coin[0]),
                     self._kline(symbol=coin[0],
                                 start_dt=datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=2), 
                                 limit=1)
                 )
-                for coin in self.spot_coins
+                for coin in (self.spot_coins if coins is None else coins)
             ]
         elif mode == 'init':
             return [
                 (
-                    coin[0].replace('-', ''),
+                    self.norm_symbol(coin[0]),
                     self._kline(symbol=coin[0],
                                 limit=300)
                 )
-                for coin in self.spot_coins
+                for coin in (self.spot_coins if coins is None else coins)
             ]
         elif mode == 'custom':
             return [
                 (
-                    coin[0].replace('-', ''),
+                    self.norm_symbol(coin[0]),
                     self._kline(symbol=coin[0],
                             limit=limit,
                             start_dt=start_dt,
                             end_dt=end_dt)
                 )
-                for coin in self.spot_coins
+                for coin in (self.spot_coins if coins is None else coins)
             ]
\ No newline at end of file
@@ -1,11 +1,18 @@
-from typing import Literal
-from exchange import Exchange, Bybit, Binance, Gateio, Kraken, Okx
+from typing import Iterable, Iterator, Literal
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from exchange import Exchange, Bybit, Binance, Gateio, Kraken, Okx, TIME_FRAMES
 import pandas as pd
 import datetime, calendar
+import time
 from raw_etl import RawETLoader, DmETLoader
-from ccyconv import rates_process
+from ccyconv import RateIndex
+from pipeline import StagedPipeline
+from metrics import metrics
+from profiling import profiler, PROFILE_MODES
+from superset_cache import refresh_dashboard_cache
  
 import re
+import os
 import argparse
 
 
@@ -29,61 +36,304 @@ def createParser():
     parser.add_argument('-m', '--mode', nargs='?', default='incremental', choices=['initial', 'incremental', 'custom'])
     parser.add_argument('-d', '--start_dt', nargs='?', default='2025-01-01', type=dt_regex_type)
     parser.add_argument('-e', '--exchange', nargs='*', default=None, choices=['Bybit', 'Binance', 'Gateio', 'Kraken', 'Okx'], type=str)
+    parser.add_argument('-r', '--rate_pref', nargs='?', default='venue', choices=['venue', 'global'])
+    parser.add_argument('-b', '--batch_size', nargs='?', default=50, type=int)
+    parser.add_argument('-t', '--time_frame', nargs='?', default='D', choices=list(TIME_FRAMES))
+    parser.add_argument('--metrics_dir', nargs='?', default='telemetry', type=str)
+    parser.add_argument('--resume', action='store_true')
+    parser.add_argument('--rebuild', action='store_true', help='reload the DM layer from the raw layer, no exchange requests')
+    parser.add_argument('--info_snapshot_ttl', nargs='?', default=0, type=int, help='minutes a local instrument list snapshot is used instead of the request, 0 always requests')
+    parser.add_argument('-w', '--transform_workers', nargs='?', default=1, type=int, help='processes transforming raw klines, 1 transforms in-process')
+    parser.add_argument('--raw_format', nargs='?', default='json', choices=['json', 'packed'], help='packed also stores the candles of raw klines as packed arrays, read without JSON parsing')
+    parser.add_argument('--profile', nargs='*', default=None, choices=PROFILE_MODES)
+    parser.add_argument('--profile_dir', nargs='?', default='profiles', type=str)
+    parser.add_argument('--superset_url', nargs='?', default=os.environ.get('SUPERSET_URL'), type=str, help='refresh the dashboard cache after a successful run')
     return parser
 
 
-def load(exchange: Exchange, start_dt: datetime.datetime, raw_etl: RawETLoader, dm_etl: DmETLoader):
-    # raw
-    kline_list = exchange.load_kline(mode='custom', start_dt=start_dt)  
+def load(exchange: Exchange, start_dt: datetime.datetime, raw_etl: RawETLoader, dm_etl: DmETLoader, batch_size: int = 50, pd_registry: pd.DataFrame | None = None,
+         run_key: str | None = None, resume: bool = False, time_frame: str = 'D', rebuild: bool = False):
+    # instrument info and registry first: facts are keyed by its integer ids (skipped when the caller keeps a synced registry)
+    if pd_registry is None:
+        pd_registry = sync_info(exchange, start_dt, raw_etl, dm_etl)
+    if rebuild:
+        # checkpoints of a rebuild are kept apart from the ones of fetching runs
+        return rebuild_klines(exchange.name, raw_etl, dm_etl, pd_registry, start_dt, f'rebuild:{run_key or start_dt.date()}', batch_size, time_frame)
+
+    # symbols loaded to the DM layer are checkpointed per batch, a resumed run fetches only the rest
+    run_key = run_key or f'custom:{start_dt:%Y-%m-%d}'
+    if resume:
+        done_symbols = raw_etl.checkpoint_read(run_key, exchange.name)
+        print(f'Info: resuming {exchange.name} {run_key}, {len(done_symbols)} symbol(s) already loaded')
+    else:
+        done_symbols = set()
+        raw_etl.checkpoint_clear(run_key, exchange.name)
+    coins = [coin for coin in exchange.spot_coins if exchange.norm_symbol(coin[0]) not in done_symbols]
+
+    # klines: fetch -> transform in memory -> dm upsert run concurrently on symbol batches,
+    # the fetched responses are written to the raw layer by a background thread meanwhile
+    def transform_stage(batch: tuple) -> tuple | None:
+        kline_list, kline_ts = batch
+        kline_ts = kline_ts or calendar.timegm(datetime.datetime.now(tz=datetime.timezone.utc).timetuple()) * 1000
+        with profiler.stage('kline_insert', exchange.name):
+            raw_insert = raw_etl.kline_insert_async(exchange.name, kline_list, kline_ts, time_frame)
+        with profiler.stage('kline_transform', exchange.name):
+            pd_kline = raw_etl.kline_frame(exchange.name, kline_list, kline_ts, time_frame)
+        pd_kline = join_registry(exchange.name, pd_kline, pd_registry)
+        return (pd_kline, raw_insert) if pd_kline is not None else None
+
+    def dm_stage(batch: tuple) -> pd.DataFrame:
+        # the batch is checkpointed once its raw insert is committed too: resume and rates read done symbols back from the raw layer
+        pd_kline, raw_insert = batch
+        return dm_klines(exchange.name, raw_etl, dm_etl, pd_kline, run_key, start_dt, time_frame, raw_insert)
+
+    def load_kline() -> Iterator[tuple]:
+        batches = exchange.iter_kline(batch_size, coins, time_frame, mode='custom', start_dt=start_dt)
+        while True:
+            with profiler.stage('load_kline', exchange.name):
+                batch = next(batches, None)
+            if batch is None:
+                return
+            yield batch
+
+    pipeline = StagedPipeline(exchange.name)\
+        .add_stage('kline_transform', transform_stage)\
+        .add_stage('tbl_load', dm_stage)
+    try:
+        pd_kline_list = pipeline.run(load_kline() if profiler.enabled else exchange.iter_kline(batch_size, coins, time_frame, mode='custom', start_dt=start_dt), source_name='load_kline')
+    finally:
+        # the raw layer is complete before a resume or a rebuild may read it
+        raw_etl.kline_insert_wait()
+    # klines of symbols loaded before the restart are read back from the raw layer for the rates
+    done_symbol_list = sorted(done_symbols)
+    for i in range(0, len(done_symbol_list), batch_size):
+        pd_kline = read_klines(exchange.name, raw_etl, pd_registry, start_dt, done_symbol_list[i:i + batch_size], time_frame)
+        if pd_kline is not None:
+            pd_kline_list.append(pd_kline)
+    return pd.concat(pd_kline_list, ignore_index=True) if pd_kline_list else pd.DataFrame(columns=['symbol', 'oper_dt', 'price_avg', 'base_coin', 'quote_coin'])
+
+
+def rebuild_klines(exchange_type: str, raw_etl: RawETLoader, dm_etl: DmETLoader, pd_registry: pd.DataFrame, start_dt: datetime.datetime, run_key: str,
+                   batch_size: int = 50, time_frame: str = 'D') -> pd.DataFrame:
+    # DM layer from the raw layer only (no requests): klines of every registry symbol inserted since start_dt, in batches
+    symbol_list = sorted(pd_registry['symbol'].astype(str).unique())
+    pd_kline_list = []
+    for i in range(0, len(symbol_list), batch_size):
+        pd_kline = read_klines(exchange_type, raw_etl, pd_registry, start_dt, symbol_list[i:i + batch_size], time_frame)
+        if pd_kline is not None:
+            pd_kline_list.append(dm_klines(exchange_type, raw_etl, dm_etl, pd_kline, run_key, start_dt, time_frame))
+    return pd.concat(pd_kline_list, ignore_index=True) if pd_kline_list else pd.DataFrame(columns=['symbol', 'oper_dt', 'price_avg', 'base_coin', 'quote_coin'])
+
+
+def read_klines(exchange_type: str, raw_etl: RawETLoader, pd_registry: pd.DataFrame, start_dt: datetime.datetime, symbols: list, time_frame: str = 'D') -> pd.DataFrame | None:
+    # klines of a batch of symbols from the raw layer joined with the registry, None if there are none
+    with profiler.stage('kline_read', exchange_type):
+        pd_kline = raw_etl.kline_read(exchange_type, 'incremental', start_dt=start_dt, symbols=symbols, time_frame=time_frame)
+    return join_registry(exchange_type, pd_kline, pd_registry)
+
+
+def join_registry(exchange_type: str, pd_kline: pd.DataFrame, pd_registry: pd.DataFrame) -> pd.DataFrame | None:
+    # transformed klines with instrument ids and coins of the registry, None if there are none
+    if pd_kline.empty:
+        return None
+    pd_kline['symbol'] = pd_kline['symbol'].cat.set_categories(pd_registry['symbol'].cat.categories)
+    pd_kline = pd_kline.join(pd_registry.set_index('symbol'), on='symbol')
+    if pd_kline['instrument_id'].isnull().any():
+        print(f'Warning: {pd_kline["instrument_id"].isnull().sum()} kline rows of {exchange_type} have no instrument in registry, skipped')
+        pd_kline = pd_kline[pd_kline['instrument_id'].notnull()]
+    return pd_kline
+
+
+def dm_klines(exchange_type: str, raw_etl: RawETLoader, dm_etl: DmETLoader, pd_kline: pd.DataFrame, run_key: str, start_dt: datetime.datetime, time_frame: str = 'D',
+              raw_insert: Future | None = None) -> pd.DataFrame:
+    # upserts a batch of klines into the DM layer and checkpoints its symbols under run_key (after raw_insert of the batch, if given, has committed)
+    tbl_name, df_tbl = dm_frame('tfct_coin', pd_kline, time_frame)
+    with profiler.stage('tbl_load', exchange_type):
+        dm_etl.tbl_load(tbl_name=tbl_name, df_tbl=df_tbl[dm_etl.get_tbl_cols(tbl_name)])
+    if raw_insert is not None:
+        try:
+            raw_insert.result()
+        except Exception:
+            # reported by kline_insert_wait; the symbols are fetched again on resume
+            print(f'Warning: raw insert of a {exchange_type} batch failed, its {pd_kline["symbol"].nunique()} symbol(s) are not checkpointed')
+            return pd_kline
+    # symbols without rows (failed or empty responses) are not checkpointed and get retried on resume
+    df_progress = pd_kline.groupby('symbol', as_index=False, observed=True).agg(window_end=('oper_dt', 'max'), rows_loaded=('oper_dt', 'size'))
+    df_progress['window_start'] = start_dt.date()
+    df_progress['window_end'] = df_progress['window_end'].dt.date
+    raw_etl.checkpoint_write(run_key, exchange_type, df_progress)
+    return pd_kline
+
+
+def dm_frame(tbl_name: str, df: pd.DataFrame, time_frame: str = 'D') -> tuple:
+    # intraday facts go to <tbl_name>_intraday keyed by time_frame and candle open time oper_ts
+    if time_frame == 'D':
+        return tbl_name, df
+    return f'{tbl_name}_intraday', df.rename(columns={'oper_dt': 'oper_ts'}).assign(time_frame=time_frame)
+
+
+def sync_info(exchange: Exchange, start_dt: datetime.datetime, raw_etl: RawETLoader, dm_etl: DmETLoader) -> pd.DataFrame:
     raw_etl.info_insert(exchange.name, exchange.info_resp, exchange.info_ts)
-    raw_etl.kline_insert(exchange.name, kline_list, exchange.kline_ts)
-    # load from raw
     pd_info = raw_etl.info_read(exchange.name, 'incremental', start_dt=start_dt)
-    pd_kline = raw_etl.kline_read(exchange.name, 'incremental', start_dt=start_dt)
-    # load to dm
-    tbl_name = 'dim_coin'
-    tbl_cols = dm_etl.get_tbl_cols(tbl_name)
-    dm_etl.tbl_load(tbl_name=tbl_name, df_tbl=pd_info[tbl_cols])
-
-    tbl_name = 'tfct_coin'
-    tbl_cols = dm_etl.get_tbl_cols(tbl_name)
-    dm_etl.tbl_load(tbl_name=tbl_name, df_tbl=pd_kline[tbl_cols])
-
-    tbl_name = 'tfct_exchange_rate'
-    tbl_cols = dm_etl.get_tbl_cols(tbl_name)
-    pd_rate: pd.DataFrame = pd_kline.merge(pd_info[['exchange', 'symbol', 'base_coin', 'quote_coin', 'insert_ts']], 'left', on=['exchange', 'symbol'])
-    non_usdt_coin_list = pd_rate[pd_rate['quote_coin'] != 'USDT']['quote_coin'].drop_duplicates(ignore_index=True).to_list()
-    pd_rate = rates_process(
-        pd_rate[(pd_rate['base_coin'].isin(non_usdt_coin_list) & (pd_rate['quote_coin'] == 'USDT')) | (pd_rate['quote_coin'].isin(non_usdt_coin_list) & (pd_rate['base_coin'] == 'USDT'))][['oper_dt', 'base_coin', 'quote_coin', 'symbol', 'price_avg']], 
-        non_usdt_coin_list, 
-        goal_coin='USDT'
-    )
+    return dm_etl.registry_sync(exchange.name, pd_info)
+
+
+def load_rates(exchange_type: str, rate_index: RateIndex, dm_etl: DmETLoader, time_frame: str = 'D'):
+    pd_rate = rate_index.query(exchange_type)
+    if pd_rate.empty:
+        print(f'Info: no {exchange_type} rates to load')
+        return
     pd_rate['insert_ts'] = calendar.timegm(datetime.datetime.now().timetuple()) * 1000
-    pd_rate['exchange'] = exchange.name
-    for _, row in pd_rate[pd_rate['conversion_path'].isnull()].iterrows():
-        print(f'Warning: convertion rate from {row["coin"]} to USDT not found for {row["exchange"]} ({row["oper_dt"]})')
-    dm_etl.tbl_load(tbl_name=tbl_name, df_tbl=pd_rate[tbl_cols])
+    pd_rate['exchange_id'] = dm_etl.get_exchange_id(exchange_type)
+    pd_rate['coin_id'] = pd_rate['coin'].map(dm_etl.asset_ids)
+    pd_missing = pd_rate[pd_rate['usdt_amt'].isnull()]
+    if not pd_missing.empty:
+        print(f'Warning: convertion rate to USDT not found for {exchange_type} on {len(pd_missing)} coin-date(s) (coins: {", ".join(pd_missing["coin"].drop_duplicates().to_list())})')
+    print(f'Info: {exchange_type} rates by source {pd_rate["rate_source"].value_counts(dropna=False).to_dict()}')
+    tbl_name, pd_rate = dm_frame('tfct_exchange_rate', pd_rate, time_frame)
+    pd_rate = changed_rates(exchange_type, tbl_name, pd_rate, dm_etl, time_frame)
+    if pd_rate.empty:
+        return
+    with profiler.stage('tbl_load', exchange_type):
+        dm_etl.tbl_load(tbl_name=tbl_name, df_tbl=pd_rate[dm_etl.get_tbl_cols(tbl_name)])
+
+
+def changed_rates(exchange_type: str, tbl_name: str, pd_rate: pd.DataFrame, dm_etl: DmETLoader, time_frame: str = 'D') -> pd.DataFrame:
+    """
+    Rows of pd_rate that are not stored yet or differ from the stored rates.
+    Rates are computed from the loaded prices of every date and compared with the table rather than trusted to changed facts:
+    a corrected price leaves vol_amt as is, and a run stopped before its rates leaves facts newer than them
+    """
+    date_col = 'oper_dt' if time_frame == 'D' else 'oper_ts'
+    pd_rate = pd_rate.astype({'coin_id': 'Int32', date_col: 'datetime64[ns]'})
+    df_stored = dm_etl.rate_read(tbl_name, exchange_type, pd_rate[date_col].min().to_pydatetime(), pd_rate[date_col].max().to_pydatetime(), time_frame)
+    df_rate = pd_rate.merge(df_stored.astype({'coin_id': 'Int32'}), 'left', on=['coin_id', date_col], suffixes=('', '_stored'), indicator=True)
+    both_null = df_rate['usdt_amt'].isnull() & df_rate['usdt_amt_stored'].isnull()
+    is_changed = ((df_rate['_merge'] == 'left_only') | ((df_rate['usdt_amt'] != df_rate['usdt_amt_stored']) & ~both_null)).to_numpy()
+    n_dates, n_changed = pd_rate[date_col].nunique(), pd_rate.loc[is_changed, date_col].nunique()
+    metrics.inc('rates_dates_total', n_changed, exchange=exchange_type, status='changed')
+    metrics.inc('rates_dates_total', n_dates - n_changed, exchange=exchange_type, status='unchanged')
+    print(f'Info: {exchange_type} rates changed on {n_changed} of {n_dates} date(s)')
+    return pd_rate[is_changed]
  
     
+def init_exchanges(exchange_cls_list: list) -> Iterator[Exchange]:
+    """
+    Creates the exchanges concurrently on first iteration and yields each one as soon as its instrument list is there,
+    so loading of fast venues starts without waiting for slow ones
+    """
+    def create(exchange_cls: type) -> Exchange:
+        t0 = time.perf_counter()
+        exchange = exchange_cls()
+        metrics.record('exchange_init', t0, exchange=exchange.name)
+        return exchange
+
+    if not exchange_cls_list:
+        return
+    with ThreadPoolExecutor(len(exchange_cls_list), thread_name_prefix='exchange-init') as pool:
+        for future in as_completed([pool.submit(create, exchange_cls) for exchange_cls in exchange_cls_list]):
+            yield future.result()
+
+
 def pipeline_launch(
         mode: Literal['initial', 'incremental', 'custom'] = 'incremental', 
         start_dt: datetime.datetime = datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=1),
-        exchange_input_list: list | None = None
+        exchange_input_list: list | None = None,
+        rate_pref: Literal['venue', 'global'] = 'venue',
+        batch_size: int = 50,
+        resume: bool = False,
+        time_frame: str = 'D',
+        transform_workers: int = 1,
+        rebuild: bool = False,
+        info_snapshot_ttl: int = 0,
+        raw_format: Literal['json', 'packed'] = 'json'
     ):
-    raw_etl, dm_etl = RawETLoader(), DmETLoader()
-    exchange_list: list[Exchange] = [exchange() for key,exchange in exchange_dict.items() if key in exchange_input_list] if exchange_input_list else [exchange() for key,exchange in exchange_dict.items()]
+    # info_snapshot_ttl (minutes): instrument lists may be taken from local snapshots of that age
+    Exchange.snapshot_ttl = info_snapshot_ttl * 60
+    raw_etl, dm_etl = RawETLoader(transform_workers, raw_format), DmETLoader()
+    exchange_cls_list = [exchange for key, exchange in exchange_dict.items() if not exchange_input_list or key in exchange_input_list]
+    try:
+        run_loads(init_exchanges(exchange_cls_list), raw_etl, dm_etl, mode, start_dt, rate_pref, batch_size, resume=resume, time_frame=time_frame, rebuild=rebuild)
+    finally:
+        raw_etl.close()
+
+
+def run_loads(
+        exchange_list: Iterable[Exchange],
+        raw_etl: RawETLoader,
+        dm_etl: DmETLoader,
+        mode: Literal['initial', 'incremental', 'custom'] = 'incremental',
+        start_dt: datetime.datetime | None = None,
+        rate_pref: Literal['venue', 'global'] = 'venue',
+        batch_size: int = 50,
+        registry_dict: dict | None = None,
+        path_cache: dict | None = None,
+        resume: bool = False,
+        time_frame: str = 'D',
+        rebuild: bool = False
+    ) -> dict:
+    """
+    Loads klines of every exchange, then rates from all of them.
+    registry_dict (exchange -> synced registry) and path_cache let a long-running caller skip the instrument info sync
+    and conversion path searches done in a previous run.
+    resume skips symbols checkpointed by an interrupted run with the same mode and start date.
+    time_frame other than 'D' loads intraday candles into the *_intraday tables (incremental: the last day of them).
+    rebuild reloads the DM layer from the raw klines inserted since the start date without requesting the exchanges.
+    Returns exchange -> loaded klines
+    """
+    # rates are computed once per run from all loaded exchanges' pairs
+    rate_index = RateIndex(goal_coin='USDT', prefer_venue=rate_pref == 'venue', path_cache=path_cache)
+    pd_kline_dict = {}
     
     for exchange in exchange_list:
-        if mode == 'incremental':
-            start_dt = datetime.datetime.combine(dm_etl.get_abs_values(exchange.name)['max_dt'], datetime.datetime.min.time()) - datetime.timedelta(days=2)
-        elif mode == 'initial':
-            start_dt = datetime.datetime(2025, 1, 1)
-        elif mode == 'custom':
-            start_dt = datetime.datetime(2025, 1, 1) if start_dt <= datetime.datetime(2025, 1, 1) else start_dt
+        ex_start_dt = resolve_start_dt(mode, start_dt, dm_etl, exchange.name, time_frame)
         try:
-            load(exchange, start_dt, raw_etl, dm_etl)
+            with metrics.timer('load', exchange=exchange.name):
+                pd_kline = load(exchange, ex_start_dt, raw_etl, dm_etl, batch_size, (registry_dict or {}).get(exchange.name),
+                                make_run_key(mode, ex_start_dt, time_frame), resume, time_frame, rebuild)
+            pd_kline_dict[exchange.name] = pd_kline
+            if time_frame == 'D':
+                dm_etl.update_abs_values(exchange.name, pd_kline['oper_dt'])
+            non_usdt_coin_list = pd_kline[pd_kline['quote_coin'] != 'USDT']['quote_coin'].drop_duplicates(ignore_index=True).to_list()
+            rate_index.add_pairs(exchange.name, pd_kline, non_usdt_coin_list)
         except Exception as msg:
             print(f'Exception: {msg} occured while loading {exchange.name} data...')
+            metrics.inc('load_errors_total', exchange=exchange.name, step='load')
+        profiler.dump_exchange(exchange.name)
+
+    build_rates(rate_index, dm_etl, time_frame)
+    return pd_kline_dict
+
+
+def resolve_start_dt(mode: Literal['initial', 'incremental', 'custom'], start_dt: datetime.datetime | None, dm_etl: DmETLoader, exchange_type: str, time_frame: str = 'D') -> datetime.datetime:
+    # first candle to load for the exchange: by the DM watermark (incremental) or the requested date, not before 2025-01-01
+    if mode == 'incremental' and time_frame != 'D':
+        # watermarks are kept for daily candles only
+        return datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=1)
+    elif mode == 'incremental' and dm_etl.get_abs_values(exchange_type).get('max_dt') is None:
+        # nothing loaded for the exchange yet
+        return datetime.datetime(2025, 1, 1)
+    elif mode == 'incremental':
+        return datetime.datetime.combine(dm_etl.get_abs_values(exchange_type)['max_dt'], datetime.datetime.min.time()) - datetime.timedelta(days=2)
+    elif mode == 'initial' or start_dt is None:
+        return datetime.datetime(2025, 1, 1)
+    return datetime.datetime(2025, 1, 1) if start_dt <= datetime.datetime(2025, 1, 1) else start_dt
+
+
+def make_run_key(mode: str, start_dt: datetime.datetime, time_frame: str = 'D') -> str:
+    return f'{mode}:{start_dt:%Y-%m-%d}' if time_frame == 'D' else f'{mode}:{time_frame}:{start_dt:%Y-%m-%d %H:%M}'
+
+
+def build_rates(rate_index: RateIndex, dm_etl: DmETLoader, time_frame: str = 'D') -> None:
+    # rates of every venue from the pairs added to rate_index
+    with metrics.timer('rate_index_build'), profiler.stage('rates_process'):
+        rate_index.build()
+    for exchange_type in rate_index.venue_rates:
+        try:
+            load_rates(exchange_type, rate_index, dm_etl, time_frame)
+        except Exception as msg:
+            print(f'Exception: {msg} occured while loading {exchange_type} rates...')
+            metrics.inc('load_errors_total', exchange=exchange_type, step='load_rates')
 
 
 if __name__ == "__main__":
@@ -93,4 +343,13 @@ if __name__ == "__main__":
     print(namespace, namespace.mode, namespace.start_dt, namespace.exchange, sep='\n')
 
 
-    pipeline_launch(mode=namespace.mode, start_dt=datetime.datetime.strptime(namespace.start_dt, '%Y-%m-%d'), exchange_input_list=namespace.exchange)
+    profiler.start(namespace.profile, namespace.profile_dir)
+    try:
+        pipeline_launch(mode=namespace.mode, start_dt=datetime.datetime.strptime(namespace.start_dt, '%Y-%m-%d'), exchange_input_list=namespace.exchange, rate_pref=namespace.rate_pref, batch_size=namespace.batch_size, resume=namespace.resume, time_frame=namespace.time_frame, transform_workers=namespace.transform_workers, rebuild=namespace.rebuild,
+                        info_snapshot_ttl=namespace.info_snapshot_ttl, raw_format=namespace.raw_format)
+        # cached dashboard charts are re-warmed with the new data; a failed load keeps the previous cache
+        if namespace.superset_url and not any(name == 'load_errors_total' for name, _ in metrics.counters):
+            refresh_dashboard_cache(namespace.superset_url, os.environ.get('SUPERSET_USER', 'superset'), os.environ.get('SUPERSET_PASSWORD', 'superset'))
+    finally:
+        metrics.export(namespace.metrics_dir, args=vars(namespace))
+        profiler.stop()
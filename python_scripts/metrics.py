@@ -0,0 +1,196 @@
+"""
+Run telemetry: counters, gauges and histograms collected across the ETL modules,
+exported as a Prometheus text file (node_exporter textfile collector format) and as a JSON run report.
+
+Compare two run reports:
+    python metrics.py old_report.json new_report.json --threshold 0.2
+"""
+from contextlib import contextmanager
+from typing import Iterator
+import argparse
+import json
+import os
+import threading
+import time
+
+
+class Metrics:
+    buckets: tuple = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+    prefix: str = 'bhft_etl_'
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.counters: dict = {}
+        self.gauges: dict = {}
+        self.histograms: dict = {}
+
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+
+
+    def set_once(self, name: str, value: float, **labels) -> bool:
+        """
+        Sets the gauge unless it is already set in this run, returns whether it was set
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            if key in self.gauges:
+                return False
+            self.gauges[key] = value
+            return True
+
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self.histograms.setdefault(key, {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * len(self.buckets)})
+            hist['count'] += 1
+            hist['sum'] += value
+            hist['max'] = max(hist['max'], value)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist['buckets'][i] += 1
+
+
+    @contextmanager
+    def timer(self, stage: str, **labels) -> Iterator[None]:
+        """
+        Observes wall time of the block in stage_duration_seconds{stage=..., **labels}
+        """
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_duration_seconds', time.perf_counter() - t0, stage=stage, **labels)
+
+
+    def record(self, stage: str, t0: float, rows: int | None = None, **labels) -> None:
+        """
+        Observes time.perf_counter() - t0 in stage_duration_seconds and adds rows to stage_rows_total
+        """
+        self.observe('stage_duration_seconds', time.perf_counter() - t0, stage=stage, **labels)
+        if rows is not None:
+            self.inc('stage_rows_total', rows, stage=stage, **labels)
+
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self.counters, self.gauges, self.histograms = {}, {}, {}
+
+
+    @staticmethod
+    def _fmt_labels(labels: tuple, extra: tuple = ()) -> str:
+        items = labels + extra
+        if not items:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in items) + '}'
+
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for kind, store in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted({name for name, _ in store}):
+                    lines.append(f'# TYPE {self.prefix}{name} {kind}')
+                    lines += [f'{self.prefix}{name}{self._fmt_labels(labels)} {value}' for (n, labels), value in sorted(store.items()) if n == name]
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f'# TYPE {self.prefix}{name} histogram')
+                for (n, labels), hist in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    for bound, cnt in zip(self.buckets, hist['buckets']):
+                        lines.append(f'{self.prefix}{name}_bucket{self._fmt_labels(labels, (("le", bound),))} {cnt}')
+                    lines.append(f'{self.prefix}{name}_bucket{self._fmt_labels(labels, (("le", "+Inf"),))} {hist["count"]}')
+                    lines.append(f'{self.prefix}{name}_sum{self._fmt_labels(labels)} {hist["sum"]}')
+                    lines.append(f'{self.prefix}{name}_count{self._fmt_labels(labels)} {hist["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+    def report(self, **run_info) -> dict:
+        def series(store: dict, fmt) -> list:
+            return [{'name': name, 'labels': dict(labels), **fmt(value)} for (name, labels), value in sorted(store.items())]
+
+        with self._lock:
+            return {
+                'run': {'started_at': self.started_at, 'duration_s': time.time() - self.started_at, **run_info},
+                'counters': series(self.counters, lambda v: {'value': v}),
+                'gauges': series(self.gauges, lambda v: {'value': v}),
+                'histograms': series(self.histograms, lambda h: {
+                    'count': h['count'], 'sum': h['sum'], 'max': h['max'], 'mean': h['sum'] / h['count'] if h['count'] else 0.0
+                }),
+            }
+
+
+    def export(self, metrics_dir: str, **run_info) -> tuple:
+        """
+        Writes metrics.prom (overwritten every run) and run_report_<started_at>.json (kept as history)
+        """
+        os.makedirs(metrics_dir, exist_ok=True)
+        prom_path = os.path.join(metrics_dir, 'metrics.prom')
+        with open(prom_path + '.tmp', 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(prom_path + '.tmp', prom_path)
+        report_path = os.path.join(metrics_dir, 'run_report_{}.json'.format(time.strftime('%Y%m%dT%H%M%S', time.gmtime(self.started_at))))
+        with open(report_path, 'w') as f:
+            json.dump(self.report(**run_info), f, indent=2, default=str)
+        print(f'Info: metrics written to {prom_path}, {report_path}')
+        return prom_path, report_path
+
+
+def compare_reports(old_report: dict, new_report: dict, threshold: float = 0.2) -> list:
+    """
+    Compares mean durations (histograms) and counters of two run reports with matching name and labels.
+    Returns list of dicts for series that got worse by more than threshold (relative):
+    slower histograms, higher error/retry/throttle counters
+    """
+    def index(report: dict, section: str) -> dict:
+        return {(s['name'], tuple(sorted(s['labels'].items()))): s for s in report.get(section, [])}
+
+    regressions = []
+    old_hist, new_hist = index(old_report, 'histograms'), index(new_report, 'histograms')
+    for key in old_hist.keys() & new_hist.keys():
+        old_val, new_val = old_hist[key]['mean'], new_hist[key]['mean']
+        if old_val > 0 and new_val > old_val * (1 + threshold):
+            regressions.append({'name': key[0], 'labels': dict(key[1]), 'old': old_val, 'new': new_val, 'change': new_val / old_val - 1})
+    old_cnt, new_cnt = index(old_report, 'counters'), index(new_report, 'counters')
+    for key in new_cnt.keys():
+        if not any(word in key[0] for word in ('error', 'retries', 'throttled')):
+            continue
+        old_val, new_val = old_cnt.get(key, {'value': 0})['value'], new_cnt[key]['value']
+        if new_val > old_val * (1 + threshold):
+            regressions.append({'name': key[0], 'labels': dict(key[1]), 'old': old_val, 'new': new_val, 'change': new_val / old_val - 1 if old_val else None})
+    return sorted(regressions, key=lambda r: (r['name'], str(r['labels'])))
+
+
+metrics = Metrics()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('old_report')
+    parser.add_argument('new_report')
+    parser.add_argument('-t', '--threshold', nargs='?', default=0.2, type=float)
+    namespace = parser.parse_args()
+
+    with open(namespace.old_report) as f_old, open(namespace.new_report) as f_new:
+        regression_list = compare_reports(json.load(f_old), json.load(f_new), namespace.threshold)
+    for r in regression_list:
+        print(f'Regression: {r["name"]} {r["labels"]} {r["old"]:.4g} -> {r["new"]:.4g}')
+    if not regression_list:
+        print('Info: no regressions found')
+    raise SystemExit(1 if regression_list else 0)
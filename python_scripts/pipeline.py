@@ -0,0 +1,123 @@
+from typing import Callable, Iterable
+import queue
+import threading
+import time
+from metrics import metrics
+
+
+_DONE = object()
+
+
+class StagedPipeline:
+    """
+    Chain of stages connected by bounded queues, each stage runs in its own thread.
+    A full queue blocks the upstream stage (backpressure), so at most maxsize batches wait between two stages
+    and wall time approaches the slowest stage instead of the sum of all of them.
+    Stage function gets one item and returns the item for the next stage (None drops it).
+    """
+    name: str
+    maxsize: int
+
+    def __init__(self, name: str, maxsize: int = 4) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.stages: list = []
+        self.busy_time: dict = {}
+        self.errors: list = []
+        self._stop = threading.Event()
+
+
+    def add_stage(self, stage_name: str, func: Callable) -> 'StagedPipeline':
+        self.stages.append((stage_name, func))
+        self.busy_time[stage_name] = 0.0
+        return self
+
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+
+    def _fail(self, stage_name: str, msg: Exception) -> None:
+        print(f'Exception: {msg} in stage {stage_name} of {self.name} pipeline')
+        self.errors.append(msg)
+        metrics.inc('pipeline_errors_total', pipeline=self.name, stage=stage_name)
+        self._stop.set()
+
+
+    def _source(self, source: Iterable, stage_name: str, q_out: queue.Queue) -> None:
+        try:
+            iterator = iter(source)
+            while True:
+                t0 = time.perf_counter()
+                item = next(iterator, _DONE)
+                self.busy_time[stage_name] += time.perf_counter() - t0
+                if item is _DONE or not self._put(q_out, item):
+                    break
+        except Exception as msg:
+            self._fail(stage_name, msg)
+        self._put(q_out, _DONE)
+
+
+    def _worker(self, stage_name: str, func: Callable, q_in: queue.Queue, q_out: queue.Queue) -> None:
+        while True:
+            item = self._get(q_in)
+            if item is _DONE:
+                break
+            try:
+                t0 = time.perf_counter()
+                result = func(item)
+                self.busy_time[stage_name] += time.perf_counter() - t0
+            except Exception as msg:
+                self._fail(stage_name, msg)
+                break
+            if result is not None and not self._put(q_out, result):
+                break
+        self._put(q_out, _DONE)
+
+
+    def run(self, source: Iterable, source_name: str = 'source') -> list:
+        """
+        Feeds items of source through the stages, returns outputs of the last stage.
+        Raises the first exception raised by any stage.
+        """
+        self.busy_time = {source_name: 0.0, **{stage_name: 0.0 for stage_name, _ in self.stages}}
+        queues = [queue.Queue(maxsize=self.maxsize) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._source, args=(source, source_name, queues[0]), name=f'{self.name}-{source_name}', daemon=True)]
+        for i, (stage_name, func) in enumerate(self.stages):
+            threads.append(threading.Thread(target=self._worker, args=(stage_name, func, queues[i], queues[i + 1]), name=f'{self.name}-{stage_name}', daemon=True))
+
+        t0 = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        results = []
+        while True:
+            item = self._get(queues[-1])
+            if item is _DONE:
+                break
+            results.append(item)
+        for thread in threads:
+            thread.join()
+        wall_time = time.perf_counter() - t0
+
+        metrics.set('pipeline_wall_seconds', wall_time, pipeline=self.name)
+        for stage_name, busy_time in self.busy_time.items():
+            metrics.set('pipeline_stage_busy_seconds', busy_time, pipeline=self.name, stage=stage_name)
+        print(f'Info: {self.name} pipeline {wall_time:.1f}s, stages busy ' + ', '.join(f'{k} {v:.1f}s' for k, v in self.busy_time.items()))
+        if self.errors:
+            raise self.errors[0]
+        return results
@@ -0,0 +1,178 @@
+"""
+Optional run profiling (main.py --profile): per-stage CPU profiles (cProfile), a sampling profiler over all threads
+and tracemalloc allocation snapshots with per-stage peak memory. Artefacts are written per exchange to a directory.
+Disabled by default: stage() then returns a shared no-op context and nothing is started.
+"""
+from contextlib import contextmanager, nullcontext
+from typing import Iterator
+import cProfile
+import collections
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from metrics import metrics
+
+
+PROFILE_MODES: tuple = ('cpu', 'sample', 'mem')
+_NULL = nullcontext()
+
+
+class Profiler:
+    """
+    Modes:
+        cpu    - cProfile per (exchange, stage); stages run in pipeline threads and cProfile sees the enabling thread only,
+                 so a profile is enabled around each stage call
+        sample - stacks of all threads sampled every interval seconds, folded stack files (flamegraph.pl / speedscope)
+        mem    - tracemalloc: peak traced memory per stage and a snapshot with top allocations per exchange
+    Stage peaks are measured from the memory traced at stage entry; when pipeline stages overlap they are upper bounds.
+    """
+    modes: set
+    profile_dir: str
+    interval: float
+
+    def __init__(self) -> None:
+        self.modes = set()
+        self.profile_dir = 'profiles'
+        self.interval = 0.01
+        self._lock = threading.Lock()
+        self.cpu_profiles: dict = {}
+        self.mem_peaks: dict = {}
+        self._active = 0
+        self._samples: collections.Counter = collections.Counter()
+        self._sampler: threading.Thread | None = None
+        self._stop = threading.Event()
+
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.modes)
+
+
+    def start(self, modes: list | None, profile_dir: str = 'profiles', interval: float = 0.01) -> None:
+        self.modes = set(modes or [])
+        if not self.modes:
+            return
+        self.profile_dir = profile_dir
+        self.interval = interval
+        os.makedirs(profile_dir, exist_ok=True)
+        if 'mem' in self.modes:
+            tracemalloc.start(25)
+        if 'sample' in self.modes:
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, name='profiler-sampler', daemon=True)
+            self._sampler.start()
+        print(f'Info: profiling {", ".join(sorted(self.modes))} into {profile_dir}')
+
+
+    def stage(self, stage: str, exchange: str = 'ALL'):
+        """
+        Context manager profiling one call of a stage, no-op when profiling is disabled
+        """
+        if not self.modes:
+            return _NULL
+        return self._stage(stage, exchange)
+
+
+    @contextmanager
+    def _stage(self, stage: str, exchange: str) -> Iterator[None]:
+        profile = None
+        if 'cpu' in self.modes:
+            with self._lock:
+                profile = self.cpu_profiles.setdefault((exchange, stage), cProfile.Profile())
+        if 'mem' in self.modes:
+            with self._lock:
+                if self._active == 0:
+                    tracemalloc.reset_peak()
+                self._active += 1
+            mem_start = tracemalloc.get_traced_memory()[0]
+        try:
+            if profile is not None:
+                try:
+                    profile.enable()
+                except ValueError:
+                    # another profiler is already active in this thread
+                    profile = None
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            if 'mem' in self.modes:
+                peak = tracemalloc.get_traced_memory()[1] - mem_start
+                with self._lock:
+                    self._active -= 1
+                    self.mem_peaks[(exchange, stage)] = max(self.mem_peaks.get((exchange, stage), 0), peak)
+                metrics.set('stage_peak_memory_bytes', self.mem_peaks[(exchange, stage)], stage=stage, exchange=exchange)
+
+
+    def _sample_loop(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f'{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})')
+                    frame = frame.f_back
+                self._samples[(names.get(thread_id, str(thread_id)), ';'.join(reversed(stack)))] += 1
+
+
+    def dump_exchange(self, exchange: str) -> None:
+        """
+        Writes artefacts collected for the exchange so far: <exchange>_<stage>.prof, <exchange>_cpu.txt, <exchange>_mem.txt
+        """
+        if not self.modes:
+            return
+        if 'cpu' in self.modes:
+            with self._lock:
+                profile_list = [(stage, profile) for (ex, stage), profile in self.cpu_profiles.items() if ex == exchange]
+            stream = io.StringIO()
+            for stage, profile in profile_list:
+                profile.dump_stats(os.path.join(self.profile_dir, f'{exchange}_{stage}.prof'))
+                stream.write(f'=== {exchange} {stage} ===\n')
+                pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(30)
+            with open(os.path.join(self.profile_dir, f'{exchange}_cpu.txt'), 'w') as f:
+                f.write(stream.getvalue())
+        if 'mem' in self.modes:
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            snapshot.dump(os.path.join(self.profile_dir, f'{exchange}_mem.snapshot'))
+            with open(os.path.join(self.profile_dir, f'{exchange}_mem.txt'), 'w') as f:
+                current, peak = tracemalloc.get_traced_memory()
+                f.write(f'traced current {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB\n')
+                f.write(''.join(f'stage {stage}: peak {val / 2**20:.1f} MiB\n' for (ex, stage), val in sorted(self.mem_peaks.items()) if ex == exchange))
+                f.write('\ntop allocations by line:\n')
+                f.write(''.join(f'{stat}\n' for stat in snapshot.statistics('lineno')[:30]))
+
+
+    def stop(self) -> None:
+        """
+        Stops sampling and tracing, writes run-wide artefacts (stacks.folded per thread prefix, memory_peaks.json)
+        """
+        if not self.modes:
+            return
+        self.dump_exchange('ALL')
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+            folded: dict = collections.defaultdict(list)
+            for (thread_name, stack), cnt in self._samples.items():
+                # pipeline threads are named <EXCHANGE>-<stage>
+                folded[thread_name.split('-')[0] if '-' in thread_name else 'main'].append(f'{thread_name};{stack} {cnt}')
+            for prefix, lines in folded.items():
+                with open(os.path.join(self.profile_dir, f'{prefix}_stacks.folded'), 'w') as f:
+                    f.write('\n'.join(sorted(lines)) + '\n')
+        if 'mem' in self.modes:
+            with open(os.path.join(self.profile_dir, 'memory_peaks.json'), 'w') as f:
+                json.dump([{'exchange': ex, 'stage': stage, 'peak_bytes': val} for (ex, stage), val in sorted(self.mem_peaks.items())], f, indent=2)
+            tracemalloc.stop()
+        print(f'Info: profiles written to {self.profile_dir}')
+        self.modes = set()
+
+
+profiler = Profiler()
@@ -0,0 +1,100 @@
+"""
+Post-ETL refresh of the Superset results cache of the spot-trade dashboard: cached query results of its datasets
+are invalidated and every chart of the dashboard is re-executed through the warm-up API, so the first dashboard view
+after a load is served from cache (DATA_CACHE_CONFIG in superset_config/superset_config.py).
+
+    python superset_cache.py --superset_url http://127.0.0.1:8088
+"""
+import argparse
+import os
+import time
+import requests
+
+from metrics import metrics
+
+
+DASHBOARD_TITLE: str = 'Spot Trade Dashboard'
+
+
+class SupersetCache:
+    url: str
+    timeout: int
+
+    def __init__(self, url: str, username: str = 'superset', password: str = 'superset', timeout: int = 300) -> None:
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        resp = self.session.post(f'{self.url}/api/v1/security/login', json={'username': username, 'password': password, 'provider': 'db', 'refresh': True}, timeout=timeout)
+        resp.raise_for_status()
+        self.session.headers['Authorization'] = f'Bearer {resp.json()["access_token"]}'
+        # state-changing endpoints check the CSRF token of the session
+        resp = self.session.get(f'{self.url}/api/v1/security/csrf_token/', timeout=timeout)
+        resp.raise_for_status()
+        self.session.headers.update({'X-CSRFToken': resp.json()['result'], 'Referer': self.url})
+
+
+    def get(self, path: str, **kwargs) -> dict:
+        resp = self.session.get(f'{self.url}/api/v1/{path}', timeout=self.timeout, **kwargs)
+        resp.raise_for_status()
+        return resp.json()
+
+
+    def get_dashboard_id(self, title: str = DASHBOARD_TITLE) -> int | None:
+        result = self.get('dashboard/', params={'q': f"(filters:!((col:dashboard_title,opr:eq,value:'{title}')))"})['result']
+        return result[0]['id'] if result else None
+
+
+    def invalidate(self, dashboard_id: int) -> int:
+        """
+        Drops cached query results of the dashboard's datasets, returns the number of datasets
+        """
+        datasource_uids = [f'{dataset["id"]}__table' for dataset in self.get(f'dashboard/{dashboard_id}/datasets')['result']]
+        if datasource_uids:
+            resp = self.session.post(f'{self.url}/api/v1/cachekey/invalidate', json={'datasource_uids': datasource_uids}, timeout=self.timeout)
+            resp.raise_for_status()
+        return len(datasource_uids)
+
+
+    def warm(self, dashboard_id: int) -> int:
+        """
+        Executes every chart of the dashboard with its dashboard filters into the cache, returns the number of warmed charts
+        """
+        warmed = 0
+        for chart in self.get(f'dashboard/{dashboard_id}/charts')['result']:
+            resp = self.session.put(f'{self.url}/api/v1/chart/warm_up_cache', json={'chart_id': chart['id'], 'dashboard_id': dashboard_id}, timeout=self.timeout)
+            if resp.ok and not any(r.get('viz_error') for r in resp.json().get('result', [])):
+                warmed += 1
+            else:
+                print(f'Warning: chart {chart["id"]} ({chart.get("slice_name")}) was not warmed: {resp.status_code} {resp.text[:200]}')
+        return warmed
+
+
+def refresh_dashboard_cache(url: str, username: str = 'superset', password: str = 'superset', title: str = DASHBOARD_TITLE) -> int:
+    """
+    Invalidates and re-warms the cached charts of the dashboard, returns the number of warmed charts (0 on failure)
+    """
+    t0 = time.perf_counter()
+    try:
+        superset = SupersetCache(url, username, password)
+        dashboard_id = superset.get_dashboard_id(title)
+        if dashboard_id is None:
+            print(f'Warning: dashboard "{title}" not found in Superset, cache is not warmed')
+            return 0
+        n_datasets = superset.invalidate(dashboard_id)
+        warmed = superset.warm(dashboard_id)
+    except (requests.RequestException, KeyError, ValueError) as msg:
+        print(f'Exception: {msg} occured while refreshing Superset cache...')
+        metrics.inc('load_errors_total', exchange='ALL', step='superset_cache')
+        return 0
+    metrics.record('superset_cache_warm', t0, rows=warmed)
+    print(f'Info: Superset cache of "{title}" refreshed: {n_datasets} dataset(s) invalidated, {warmed} chart(s) warmed')
+    return warmed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--superset_url', nargs='?', default=os.environ.get('SUPERSET_URL', 'http://127.0.0.1:8088'), type=str)
+    parser.add_argument('--dashboard', nargs='?', default=DASHBOARD_TITLE, type=str)
+    namespace = parser.parse_args()
+
+    refresh_dashboard_cache(namespace.superset_url, os.environ.get('SUPERSET_USER', 'superset'), os.environ.get('SUPERSET_PASSWORD', 'superset'), namespace.dashboard)
@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+from raw_etl import RawETLoader
+from benchmarks.synthetic import info_payload
+
+
+INFO_COLS = ['exchange', 'symbol', 'native_symbol', 'base_coin', 'quote_coin', 'trading_status', 'insert_ts']
+
+
+def info_rows(exchange_type: str, data) -> pd.DataFrame:
+    return pd.DataFrame([{'exchange': exchange_type, 'insert_ts': 1735689600000, 'data': data}])
+
+
+@pytest.mark.parametrize('exchange_type', ['BYBIT', 'BINANCE', 'GATEIO', 'KRAKEN', 'OKX'])
+def test_info_transform_listed(exchange_type):
+    df_info = RawETLoader.info_transform(exchange_type, info_rows(exchange_type, info_payload(exchange_type, 10)))
+    assert list(df_info.columns) == INFO_COLS
+    assert len(df_info) == 10
+
+
+@pytest.mark.parametrize('exchange_type, data', [
+    ('BYBIT', {}),
+    ('BYBIT', {'retCode': 10006, 'retMsg': 'Too many visits!', 'result': {}}),
+    ('BINANCE', {'code': -1003, 'msg': 'Too many requests'}),
+    ('GATEIO', []),
+    ('GATEIO', {'label': 'TOO_MANY_REQUESTS', 'message': 'Request Rate limit Exceeded'}),
+    ('KRAKEN', {'error': ['EGeneral:Too many requests']}),
+    ('OKX', {'code': '50011', 'msg': 'Too Many Requests', 'data': []}),
+])
+def test_info_transform_empty_or_error(exchange_type, data):
+    # no instruments: an empty frame, so info_insert keeps the state instead of delisting everything
+    df_info = RawETLoader.info_transform(exchange_type, info_rows(exchange_type, data))
+    assert df_info.empty
+    assert list(df_info.columns) == INFO_COLS
@@ -0,0 +1,263 @@
+"""
+Kline fetching sharded over a Postgres task queue (raw.kline_task): the coordinator enqueues one (exchange, symbol, window)
+task per instrument of a run, any number of workers on any number of hosts claim tasks (FOR UPDATE SKIP LOCKED),
+fetch them with the Exchange classes and write raw rows; the coordinator loads an exchange into the DM layer
+as soon as all of its tasks are finished and the rates once every exchange is.
+
+    python worker.py coordinate -m custom -d 2025-01-01 -e Bybit Okx -t 1h --window_days 7
+    python worker.py work --batch 20          # in as many processes / nodes as the venues' rate limits allow
+"""
+import argparse
+import datetime
+import os
+import socket
+import time
+import pandas as pd
+
+from exchange import Exchange
+from raw_etl import RawETLoader, DmETLoader
+from ccyconv import RateIndex
+from metrics import metrics
+import main
+
+
+class KlineWorker:
+    """
+    Claims batches of tasks, fetches them one by one and inserts the responses into raw.exchange_api_kline.
+    Exchange instances (instrument info request) are created once per worker
+    """
+    name: str
+    batch: int
+    lease: int
+    max_attempts: int
+    retry_delay: int
+
+    def __init__(self, raw_etl: RawETLoader, run_key: str | None = None, batch: int = 20, lease: int = 600, max_attempts: int = 3, retry_delay: int = 30) -> None:
+        self.raw_etl = raw_etl
+        self.run_key = run_key
+        self.batch = batch
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.exchange_cls_dict = {cls.name: cls for cls in main.exchange_dict.values()}
+        self.exchange_dict: dict = {}
+
+
+    def get_exchange(self, exchange_type: str) -> Exchange:
+        if exchange_type not in self.exchange_dict:
+            self.exchange_dict[exchange_type] = self.exchange_cls_dict[exchange_type]()
+        return self.exchange_dict[exchange_type]
+
+
+    @staticmethod
+    def response_error(exchange_type: str, data: dict | list) -> str | None:
+        # error reported in the body of a 200 response (rate limits, unknown symbol), None for klines and empty windows
+        if not isinstance(data, dict):
+            return None
+        if exchange_type == 'BYBIT' and data.get('retCode', 0) != 0:
+            return f'retCode {data.get("retCode")}: {data.get("retMsg")}'
+        elif exchange_type == 'OKX' and str(data.get('code', '0')) != '0':
+            return f'code {data.get("code")}: {data.get("msg")}'
+        elif exchange_type == 'KRAKEN' and data.get('error'):
+            return ', '.join(map(str, data['error']))
+        return None
+
+
+    def fetch(self, task: dict) -> tuple:
+        """
+        Returns (kline_list, kline_ts) of one task. Raises if a request failed or the API reported an error;
+        a window without candles (new or halted symbol) is a successful empty response
+        """
+        exchange = self.get_exchange(task['exchange'])
+        kline_errors = exchange.kline_errors
+        if task['time_frame'] == 'D':
+            kline_list = exchange.load_kline('custom', start_dt=task['window_start'], coins=[[task['symbol']]])
+        else:
+            kline_list = exchange.load_kline_paged([[task['symbol']]], task['window_start'], task['window_end'], task['time_frame'])
+        if exchange.kline_errors > kline_errors:
+            raise ValueError(f'{exchange.kline_errors - kline_errors} of {len(kline_list)} kline request(s) failed')
+        for row in kline_list:
+            error = self.response_error(task['exchange'], row[-1])
+            if error:
+                raise ValueError(f'API error {error}')
+        return kline_list, exchange.kline_ts
+
+
+    def run_batch(self) -> int:
+        """
+        Claims and processes one batch, returns the number of claimed tasks
+        """
+        task_list = self.raw_etl.task_claim(self.name, self.batch, self.run_key, self.lease, self.max_attempts)
+        for task in task_list:
+            t0 = time.perf_counter()
+            try:
+                kline_list, kline_ts = self.fetch(task)
+                self.raw_etl.kline_insert(task['exchange'], kline_list, kline_ts, task['time_frame'])
+                self.raw_etl.task_finish([task['task_id']], 'done')
+                status = 'done'
+            except Exception as msg:
+                print(f'Exception: {msg} occured while fetching {task["exchange"]} {task["symbol"]} (attempt {task["attempts"]})...')
+                self.raw_etl.task_finish([task['task_id']], 'failed', str(msg)[:500], self.max_attempts, self.retry_delay)
+                status = 'failed'
+            metrics.record('queue_task', t0, exchange=task['exchange'], status=status)
+            metrics.inc('queue_tasks_total', exchange=task['exchange'], status=status)
+        return len(task_list)
+
+
+    def run(self, poll: float = 5.0, idle_exit: bool = False) -> None:
+        print(f'Info: worker {self.name} started' + (f' on run {self.run_key}' if self.run_key else ''))
+        while True:
+            if self.run_batch():
+                continue
+            if idle_exit and not self.raw_etl.task_waiting(self.run_key):
+                print(f'Info: worker {self.name} found no tasks, exiting')
+                return
+            time.sleep(poll)
+
+
+def make_tasks(exchange: Exchange, start_dt: datetime.datetime, time_frame: str = 'D', window_days: int | None = None) -> list:
+    """
+    Fetch tasks of every instrument of the exchange: a single window from start_dt for daily candles,
+    windows of window_days (or one up to now) for intraday ones
+    """
+    if time_frame == 'D' or not window_days:
+        window_list = [(start_dt, None)]
+    else:
+        now = datetime.datetime.now(tz=datetime.timezone.utc).replace(tzinfo=None)
+        window_start = start_dt.replace(tzinfo=None)
+        window_list = []
+        while window_start < now:
+            window_list.append((window_start, min(window_start + datetime.timedelta(days=window_days), now)))
+            window_start += datetime.timedelta(days=window_days)
+    return [
+        {'symbol': coin[0], 'time_frame': time_frame, 'window_start': window_start, 'window_end': window_end}
+        for coin in exchange.spot_coins
+        for window_start, window_end in window_list
+    ]
+
+
+def coordinate(
+        mode: str = 'incremental',
+        start_dt: datetime.datetime | None = None,
+        exchange_input_list: list | None = None,
+        rate_pref: str = 'venue',
+        batch_size: int = 50,
+        time_frame: str = 'D',
+        window_days: int | None = None,
+        resume: bool = False,
+        poll: float = 5.0,
+        transform_workers: int = 1,
+        raw_format: str = 'json'
+    ) -> dict:
+    """
+    Enqueues the run's tasks, waits for the workers and loads each finished exchange into the DM layer, then the rates.
+    resume keeps the tasks (and DM checkpoints) of an interrupted run with the same key. Returns exchange -> loaded klines
+    """
+    raw_etl, dm_etl = RawETLoader(transform_workers, raw_format), DmETLoader()
+    try:
+        rate_index = RateIndex(goal_coin='USDT', prefer_venue=rate_pref == 'venue')
+        run_dict: dict = {}
+        exchange_cls_list = [exchange_cls for key, exchange_cls in main.exchange_dict.items() if not exchange_input_list or key in exchange_input_list]
+        for exchange in main.init_exchanges(exchange_cls_list):
+            ex_start_dt = main.resolve_start_dt(mode, start_dt, dm_etl, exchange.name, time_frame)
+            run_key = main.make_run_key(mode, ex_start_dt, time_frame)
+            pd_registry = main.sync_info(exchange, ex_start_dt, raw_etl, dm_etl)
+            if not resume:
+                raw_etl.task_clear(run_key, exchange.name)
+                raw_etl.checkpoint_clear(run_key, exchange.name)
+            queued = raw_etl.task_enqueue(run_key, exchange.name, make_tasks(exchange, ex_start_dt, time_frame, window_days))
+            print(f'Info: {exchange.name} run {run_key}: {queued} task(s) enqueued')
+            run_dict[exchange.name] = (exchange, ex_start_dt, run_key, pd_registry)
+
+        pd_kline_dict = {}
+        while len(pd_kline_dict) < len(run_dict):
+            for exchange_type, (exchange, ex_start_dt, run_key, pd_registry) in run_dict.items():
+                if exchange_type in pd_kline_dict:
+                    continue
+                progress = raw_etl.task_progress(run_key).get(exchange_type, {})
+                if progress.get('pending', 0) or progress.get('running', 0):
+                    continue
+                print(f'Info: {exchange_type} tasks finished {progress}, loading DM layer')
+                if progress.get('failed'):
+                    metrics.inc('load_errors_total', progress['failed'], exchange=exchange_type, step='queue_task')
+                try:
+                    with metrics.timer('load', exchange=exchange_type):
+                        pd_kline = load_exchange(exchange, ex_start_dt, run_key, pd_registry, raw_etl, dm_etl, batch_size, time_frame)
+                    if time_frame == 'D':
+                        dm_etl.update_abs_values(exchange_type, pd_kline['oper_dt'])
+                    non_usdt_coin_list = pd_kline[pd_kline['quote_coin'] != 'USDT']['quote_coin'].drop_duplicates(ignore_index=True).to_list()
+                    rate_index.add_pairs(exchange_type, pd_kline, non_usdt_coin_list)
+                except Exception as msg:
+                    print(f'Exception: {msg} occured while loading {exchange_type} data...')
+                    metrics.inc('load_errors_total', exchange=exchange_type, step='load')
+                    pd_kline = pd.DataFrame()
+                pd_kline_dict[exchange_type] = pd_kline
+            if len(pd_kline_dict) < len(run_dict):
+                time.sleep(poll)
+
+        main.build_rates(rate_index, dm_etl, time_frame)
+        return pd_kline_dict
+    finally:
+        raw_etl.close()
+
+
+def load_exchange(exchange: Exchange, start_dt: datetime.datetime, run_key: str, pd_registry: pd.DataFrame, raw_etl: RawETLoader, dm_etl: DmETLoader,
+                  batch_size: int = 50, time_frame: str = 'D') -> pd.DataFrame:
+    # raw klines of the run's finished tasks -> DM layer in batches of symbols
+    symbol_list = sorted({exchange.norm_symbol(symbol) for symbol in raw_etl.task_symbols(run_key, exchange.name)})
+    done_symbols = raw_etl.checkpoint_read(run_key, exchange.name)
+    pd_kline_list = []
+    for i in range(0, len(symbol_list), batch_size):
+        pd_kline = main.read_klines(exchange.name, raw_etl, pd_registry, start_dt, symbol_list[i:i + batch_size], time_frame)
+        if pd_kline is None:
+            continue
+        is_done = pd_kline['symbol'].isin(done_symbols)
+        if not is_done.all():
+            pd_kline_list.append(main.dm_klines(exchange.name, raw_etl, dm_etl, pd_kline[~is_done], run_key, start_dt, time_frame))
+        # symbols checkpointed by an interrupted coordinator are read back for the rates only
+        pd_kline_list.append(pd_kline[is_done])
+    return pd.concat(pd_kline_list, ignore_index=True) if pd_kline_list else pd.DataFrame(columns=['symbol', 'oper_dt', 'price_avg', 'base_coin', 'quote_coin'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--info_snapshot_ttl', nargs='?', default=0, type=int, help='minutes a local instrument list snapshot is used instead of the request, 0 always requests')
+    parser.add_argument('--raw_format', nargs='?', default='json', choices=['json', 'packed'], help='packed also stores the candles of raw klines as packed arrays, read without JSON parsing')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    coordinator_parser = subparsers.add_parser('coordinate')
+    coordinator_parser.add_argument('-m', '--mode', nargs='?', default='incremental', choices=['initial', 'incremental', 'custom'])
+    coordinator_parser.add_argument('-d', '--start_dt', nargs='?', default='2025-01-01', type=main.dt_regex_type)
+    coordinator_parser.add_argument('-e', '--exchange', nargs='*', default=None, choices=list(main.exchange_dict), type=str)
+    coordinator_parser.add_argument('-r', '--rate_pref', nargs='?', default='venue', choices=['venue', 'global'])
+    coordinator_parser.add_argument('-b', '--batch_size', nargs='?', default=50, type=int)
+    coordinator_parser.add_argument('-t', '--time_frame', nargs='?', default='D', choices=list(main.TIME_FRAMES))
+    coordinator_parser.add_argument('--window_days', nargs='?', default=None, type=int, help='days per intraday task, one task per symbol if omitted')
+    coordinator_parser.add_argument('--resume', action='store_true')
+    coordinator_parser.add_argument('--poll', nargs='?', default=5.0, type=float)
+    coordinator_parser.add_argument('-w', '--transform_workers', nargs='?', default=1, type=int, help='processes transforming raw klines, 1 transforms in-process')
+    coordinator_parser.add_argument('--metrics_dir', nargs='?', default='telemetry', type=str)
+    worker_parser = subparsers.add_parser('work')
+    worker_parser.add_argument('--run_key', nargs='?', default=None, type=str, help='claim tasks of this run only')
+    worker_parser.add_argument('--batch', nargs='?', default=20, type=int, help='tasks claimed at once')
+    worker_parser.add_argument('--lease', nargs='?', default=600, type=int, help='seconds before a claimed task is given to another worker')
+    worker_parser.add_argument('--max_attempts', nargs='?', default=3, type=int)
+    worker_parser.add_argument('--retry_delay', nargs='?', default=30, type=int, help='seconds before a failed task is retried, doubled per attempt')
+    worker_parser.add_argument('--poll', nargs='?', default=5.0, type=float)
+    worker_parser.add_argument('--idle_exit', action='store_true', help='exit once the queue is empty')
+    worker_parser.add_argument('--metrics_dir', nargs='?', default='telemetry', type=str)
+    namespace = parser.parse_args()
+    Exchange.snapshot_ttl = namespace.info_snapshot_ttl * 60
+
+    try:
+        if namespace.command == 'coordinate':
+            coordinate(namespace.mode, datetime.datetime.strptime(namespace.start_dt, '%Y-%m-%d'), namespace.exchange, namespace.rate_pref,
+                       namespace.batch_size, namespace.time_frame, namespace.window_days, namespace.resume, namespace.poll,
+                       namespace.transform_workers, namespace.raw_format)
+        else:
+            KlineWorker(RawETLoader(raw_format=namespace.raw_format), namespace.run_key, namespace.batch, namespace.lease, namespace.max_attempts,
+                        namespace.retry_delay).run(namespace.poll, namespace.idle_exit)
+    except KeyboardInterrupt:
+        print('Info: interrupted')
+    finally:
+        metrics.export(namespace.metrics_dir, mode=f'queue_{namespace.command}')